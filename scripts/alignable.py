@@ -5,9 +5,33 @@ import sys
 import re
 import matplotlib.pyplot as plt
 import math
+import bisect
 import argparse
 import array
 import time
+import io
+import contextlib
+import traceback
+import multiprocessing
+import json
+import resource
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+# numpy and scipy are only required by the numpy engine
+try:
+	import numpy as np
+	import scipy.sparse
+except ImportError:
+	np=None
+
+# zstandard is only required by the .tar.zst archives
+try:
+	import zstandard
+except ImportError:
+	zstandard=None
 
 
 # reading the command line arguments
@@ -45,6 +69,11 @@ parser.add_argument('-H','--minHorizontalDensity', type=float, help='The minimal
 parser.add_argument('-m','--maxDistToTheDiagonal', type=int, help='The maximal distance to the diagonal (inside a given interval) for a point to be taken into account in the horizontal density', default=4)
 parser.add_argument('-D','--minDensityRatio', type=float, help='The minimal local density ratio (reported to the average local density) to keep a candidate point', default=0.5)
 parser.add_argument('-g','--maxGapSize', type=int, help='The maximal distance between to consecutive points in the same interval', default=10)
+parser.add_argument('-a','--archive', type=str, help='An archive (.zip, .tar, .tar.gz, .tar.bz2, .tar.xz or .tar.zst) where all the output files are written, instead of the output directory', default='')
+parser.add_argument('-j','--jobs', type=int, help='Number of file pairs processed in parallel (ignored with -p, the plots being shown one after the other)', default=1)
+parser.add_argument('-w','--diagWidth', type=int, help='Band mode : width of the search corridor around the path of the anchor points (0 : all the space is searched, -1 : width computed according to the anchor density)', default=0)
+parser.add_argument('--benchmark', type=str, help='A JSON file where the time spent in each stage, the throughput and the peak memory are recorded', default='')
+parser.add_argument('-e','--engine', type=str, help='The dice computation engine (python or numpy, which requires numpy and scipy)', default='python')
 
 
 args = parser.parse_args()
@@ -58,8 +87,12 @@ filePattern=re.compile(args.filePattern)
 printPlot=args.printPlot
 inputDir=args.inputDir
 outputDir=args.outputDir
+archive=args.archive
+benchmarkFile=args.benchmark
 inputFormat=args.inputFormat
 outputFormat=args.outputFormat
+engine=args.engine
+jobs=args.jobs
 
 # ngram identification
 n=args.ngram 				# ngram size
@@ -78,7 +111,11 @@ maxGapSize=args.maxGapSize	# max distance between two points to make a gap betwe
 minSentLengthRatio=0.2	# the minimal ratio between the shorter and the longer sentence to yield a candidate point
 minSentLength=1			# the minimal sentence size to look for ngram
 
-diagWidth=0 # width of the search space around the diag. If 0 : all the space is searched
+diagWidth=args.diagWidth # width of the search space around the anchor path. If 0 : all the space is searched, if -1 : automatic width
+minDiagWidth=20 # min width of the search space in automatic width mode
+minAnchorNgrams=2 # min number of shared ngrams, occurring once in each text, to make an anchor point
+
+denseBlockSize=2**22 # max number of cells of the dense dice blocks used by the numpy engine for the k best selection
 
 # direct settings
 
@@ -121,19 +158,46 @@ cesFooter="""
 </cesAna>"""
 
 
+# the points are indexed by diagonal (d=j-i) : for each diagonal, the sorted list of the x coordinates of its points
+# it is a compressed form of the summed-area table of the point grid sheared along the diagonal
+def buildDiagonals(points):
+	diagonals={}
+	for (i,j) in points.keys():
+		if j-i not in diagonals:
+			diagonals[j-i]=[]
+		diagonals[j-i].append(i)
+	for d in diagonals.keys():
+		diagonals[d].sort()
+	return diagonals
+
+# removing a point from the point hash and from the diagonal index
+def removePoint(points,diagonals,i,j):
+	del(points[(i,j)])
+	xs=diagonals[j-i]
+	del(xs[bisect.bisect_left(xs,i)])
+
 # computation of local density 
-def computeLocalDensity(i,j,points,I,J):
-	localSpaceSize=0
+# the local space is the parallelogram X in [i-deltaX,i+deltaX], Y-X in [j-i-deltaY,j-i+deltaY], clipped by the grid
+def computeLocalDensity(i,j,diagonals,I,J):
+	x0=max(0,i-deltaX)
+	x1=min(i+deltaX+1,I)
+	# size of the local space
+	if j-i+x0-deltaY>=0 and j-i+x1+deltaY<=J:
+		localSpaceSize=(x1-x0)*(2*deltaY+1)
+	else:
+		localSpaceSize=0
+		for X in range(x0,x1):
+			localSpaceSize+=max(0,min(j-(i-X)+deltaY+1,J)-max(0,j-(i-X)-deltaY))
+	# number of points in the local space, counted on each diagonal of the parallelogram
 	nbPointsInLocalSpace=0
-	for X in range(max(0,i-deltaX),min(i+deltaX+1,I)):
-		for Y in range(max(0,j-(i-X)-deltaY),min(j-(i-X)+deltaY+1,J)):
-			localSpaceSize+=1
-			if (X,Y) in points.keys():
-				nbPointsInLocalSpace+=1
+	for d in range(j-i-deltaY,j-i+deltaY+1):
+		if d in diagonals:
+			xs=diagonals[d]
+			nbPointsInLocalSpace+=bisect.bisect_left(xs,x1)-bisect.bisect_left(xs,x0)
 	return nbPointsInLocalSpace/localSpaceSize
 
 # filtering points by eliminating every point in the center of a low density local area
-def filterPoints(points,I,J,averageDensity):
+def filterPoints(points,diagonals,I,J,averageDensity):
 	# initialisation of filtered points
 	x_filtered=[]
 	y_filtered=[]
@@ -148,14 +212,14 @@ def filterPoints(points,I,J,averageDensity):
 	for point in pointsKey:
 		(i,j)=point
 		
-		localDensity=computeLocalDensity(i,j,points,I,J)
+		localDensity=computeLocalDensity(i,j,diagonals,I,J)
 		
 		if veryVerbose:
 			print ("i=",i,"j=",j,"Local density=",localDensity,"Average density=",averageDensity,"Ratio=",round(localDensity/averageDensity,2))
 		
 		# point is removed if density is not high enough
 		if localDensity/averageDensity < minDensityRatio:
-			del(points[(i,j)])
+			removePoint(points,diagonals,i,j)
 			nbDeleted+=1
 		else:
 			x_filtered.append(i)
@@ -167,7 +231,7 @@ def filterPoints(points,I,J,averageDensity):
 	return (x_filtered,y_filtered)
 
 # removing points that are conflicting on the same column : only the point with the higher local density is kept
-def resolvingConflicts(points,I,J):
+def resolvingConflicts(points,diagonals,I,J):
 	x2y={}
 	x_filtered=[]
 	y_filtered=[]
@@ -178,13 +242,13 @@ def resolvingConflicts(points,I,J):
 		if i in x2y.keys():
 			# for x coordinate, conflict between (i,j) and (i,x2y[i])
 			# only the best point is kept
-			density1=computeLocalDensity(i,j,points,I,J)
-			density2=computeLocalDensity(i,x2y[i],points,I,J)
+			density1=computeLocalDensity(i,j,diagonals,I,J)
+			density2=computeLocalDensity(i,x2y[i],diagonals,I,J)
 			if density1 > density2:
-				del(points[(i,x2y[i])])
+				removePoint(points,diagonals,i,x2y[i])
 				x2y[i]=j
 			else:
-				del(points[(i,j)])
+				removePoint(points,diagonals,i,j)
 			nbDeleted+=1	
 		else:
 			x2y[i]=j
@@ -198,284 +262,722 @@ def resolvingConflicts(points,I,J):
 		y_filtered.append(j)
 	return (x_filtered,y_filtered)
 
-# ngram that contain only the same repeated character are not valid (e.g. blank spaces...)
-def valid(ngram):
-	return not re.match(r'(.)\1+',ngram)
+# ngram profile of a sentence : the sorted integer codes of its ngrams, with their counts
+class NgramProfile:
+	__slots__=('codes','counts')
+
+	def __init__(self,codes,counts):
+		self.codes=codes
+		self.counts=counts
+
+	def __len__(self):
+		return len(self.codes)
+
+	def items(self):
+		return zip(self.codes.tolist(),self.counts.tolist())
+
+# extraction of the ngram profiles of two lists of sentences
+# the characters are replaced by their rank in the alphabet of both texts, and an ngram by the integer c1*base^(n-1)+...+cn
+# (modulo 2^64) : when the n ranks fit in 64 bits, base is a power of two and the code is exact, otherwise it is a rolling hash
+# the ngrams that begin with a repeated character are not valid (e.g. blank spaces...), and the last ngram of a sentence is not taken
+def ngramProfiles(sents1,sents2):
+	alphabet=sorted(set("".join(sents1)+"".join(sents2)))
+	bits=max(1,(len(alphabet)-1).bit_length())
+	base=2**bits if bits*n<=64 else 0x100000001b3
+	if np is not None:
+		return (ngramProfilesNumpy(sents1,alphabet,base),ngramProfilesNumpy(sents2,alphabet,base))
+	ranks={alphabet[k]:k for k in range(len(alphabet))}
+	return (ngramProfilesPython(sents1,ranks,base),ngramProfilesPython(sents2,ranks,base))
+
+def ngramProfilesPython(sents,ranks,base):
+	mask=2**64-1
+	basePower=pow(base,n,2**64)
+	profiles=[]
+	for sent in sents:
+		ranksOfSent=[ranks[char] for char in sent]
+		counts={}
+		code=0
+		for k in range(len(sent)-1):
+			code=(code*base+ranksOfSent[k])&mask
+			if k>=n:
+				code=(code-ranksOfSent[k-n]*basePower)&mask
+			if k>=n-1 and (n<2 or ranksOfSent[k-n+1]!=ranksOfSent[k-n+2]):
+				counts[code]=counts.get(code,0)+1
+		codes=sorted(counts.keys())
+		profiles.append(NgramProfile(array.array('Q',codes),array.array('l',[counts[code] for code in codes])))
+	return profiles
+
+# vectorized extraction : the ngrams of all the sentences are coded at once, then sorted by sentence and code
+def ngramProfilesNumpy(sents,alphabet,base):
+	lengths=np.array([len(sent) for sent in sents],dtype=np.int64)
+	text=np.frombuffer("".join(sents).encode('utf-32-le','surrogatepass'),dtype=np.uint32)
+	ranks=np.searchsorted(np.array([ord(char) for char in alphabet],dtype=np.uint32),text).astype(np.uint64)
+	nbPositions=max(0,len(ranks)-n+1)
+	codes=np.zeros(nbPositions,dtype=np.uint64)
+	for t in range(n):
+		codes=codes*np.uint64(base)+ranks[t:t+nbPositions]
+	# the ngram at position k of a sentence is taken if k<length-n
+	sentIds=np.repeat(np.arange(len(sents),dtype=np.int64),lengths)[:nbPositions]
+	starts=np.cumsum(lengths)-lengths
+	keep=np.arange(nbPositions,dtype=np.int64)-starts[sentIds]<lengths[sentIds]-n
+	if n>=2:
+		keep&=ranks[:nbPositions]!=ranks[1:nbPositions+1]
+	codes=codes[keep]
+	sentIds=sentIds[keep]
+	order=np.lexsort((codes,sentIds))
+	codes=codes[order]
+	sentIds=sentIds[order]
+	# distinct (sentence, code) entries, and their counts
+	first=np.ones(len(codes),dtype=bool)
+	first[1:]=(codes[1:]!=codes[:-1]) | (sentIds[1:]!=sentIds[:-1])
+	firstPositions=np.flatnonzero(first)
+	counts=np.diff(np.append(firstPositions,len(codes)))
+	codes=codes[firstPositions]
+	sentIds=sentIds[firstPositions]
+	bounds=np.searchsorted(sentIds,np.arange(len(sents)+1))
+	return [NgramProfile(codes[bounds[k]:bounds[k+1]],counts[bounds[k]:bounds[k+1]]) for k in range(len(sents))]
+
+
+# window [min,max] of the lengths nb2 (in ngrams) of the sentences that may yield a candidate point with a sentence of length nb1 :
+# the length ratio must be over minSentLengthRatio, and the dice upper bound 2*min(nb1,nb2)/(nb1+nb2) must be over diceThreshold
+# (the window is widened by one, the exact tests being done on each pair)
+def lengthWindow(nb1):
+	if nb1<=minSentLength or diceThreshold>=1:
+		return (1,0)
+	low=max(minSentLength+1,nb1*minSentLengthRatio)
+	high=nb1/minSentLengthRatio if minSentLengthRatio>0 else math.inf
+	if diceThreshold>0:
+		low=max(low,nb1*diceThreshold/(2-diceThreshold))
+		high=min(high,nb1*(2-diceThreshold)/diceThreshold)
+	return (low-1,high+1)
+
+
+# anchor points of the band mode : the points (i,j) that share at least minAnchorNgrams ngrams occurring only once in each text
+# (rare words, names, numbers...), reduced to the longest chain of points that increases on both axes
+def findAnchors(ngrams1,ngrams2):
+	where1=hapaxSentences(ngrams1)
+	where2=hapaxSentences(ngrams2)
+	nbShared={}
+	for ngram,i in where1.items():
+		j=where2.get(ngram,-1)
+		if i>=0 and j>=0:
+			nbShared[(i,j)]=nbShared.get((i,j),0)+1
+	# the points are sorted by i, then by decreasing j, so that a chain that increases on j takes at most one point per line
+	anchors=sorted([point for point,nb in nbShared.items() if nb>=minAnchorNgrams],key=lambda point: (point[0],-point[1]))
+	# longest increasing chain (patience sorting) : tails[l] is the smallest j that ends a chain of length l+1
+	tails=[]
+	tailAnchors=[]
+	previous=[]
+	for k in range(len(anchors)):
+		j=anchors[k][1]
+		l=bisect.bisect_left(tails,j)
+		if l==len(tails):
+			tails.append(j)
+			tailAnchors.append(k)
+		else:
+			tails[l]=j
+			tailAnchors[l]=k
+		previous.append(tailAnchors[l-1] if l>0 else -1)
+	chain=[]
+	k=tailAnchors[-1] if tailAnchors else -1
+	while k>=0:
+		chain.append(anchors[k])
+		k=previous[k]
+	chain.reverse()
+	if verbose:
+		print(len(chain),"anchor points")
+	return chain
+
+# returns, for each ngram, the sentence where it occurs, or -1 if it occurs more than once
+def hapaxSentences(ngrams):
+	where={}
+	for k in range(len(ngrams)):
+		for ngram,count in ngrams[k].items():
+			if ngram in where or count>1:
+				where[ngram]=-1
+			else:
+				where[ngram]=k
+	return where
+
+# search corridor of the band mode : for each i, the interval (low,high) of the j to visit, around the path that joins the anchor points
+# the corridor is widened between two anchors where the path leaves the diagonal direction (insertion or deletion)
+def corridor(anchors,lenSents1,lenSents2):
+	width=diagWidth
+	if width<0:
+		# automatic width : twice the mean distance between two anchors
+		width=max(minDiagWidth,2*lenSents1//(len(anchors)+1))
+	path=[(-1,-1)]+anchors+[(lenSents1,lenSents2)]
+	corridors=[]
+	for ((i1,j1),(i2,j2)) in zip(path,path[1:]):
+		halfWidth=(width+abs((j2-j1)-(i2-i1)))/2
+		for i in range(max(0,i1),i2):
+			center=j1+(i-i1)*(j2-j1)/(i2-i1)
+			corridors.append((max(0,int(center-halfWidth)),min(lenSents2-1,int(center+halfWidth)+1)))
+	return corridors
+
+
+# dice computation for each point (i,j) that shares at least one ngram : returns, for each coordinate, the list of candidate (dice,coordinate)
+def diceCandidates(ngrams1,ngrams2,sents1,sents2):
+	lenSents1=len(sents1)
+	lenSents2=len(sents2)
+	
+	# number of ngrams of each sentence j, and sentences j sorted by this length
+	nbs2=[max(1,len(sents2[j])-n+1) for j in range(lenSents2)]
+	sortedJ=sorted(range(lenSents2),key=lambda j: nbs2[j])
+	sortedNbs2=[nbs2[j] for j in sortedJ]
+
+	# inverted index that records, for each ngram of sents2, the keys of the sentences j that contain it, and the (j,count) pairs
+	# in band mode, the key is j, and only the sentences j of the corridor of sentence i are visited
+	# otherwise, the key is the length, and only the sentences j whose length is in the window of sentence i are visited
+	if diagWidth:
+		corridors=corridor(findAnchors(ngrams1,ngrams2),lenSents1,lenSents2)
+		order=range(lenSents2)
+		keys=order
+	else:
+		order=sortedJ
+		keys=nbs2
+	index2={}
+	for j in order:
+		for ngram,count in ngrams2[j].items():
+			if ngram not in index2:
+				index2[ngram]=([],[])
+			index2[ngram][0].append(keys[j])
+			index2[ngram][1].append((j,count))
+	
+	# record the corresponding coordinate, sorted according to dice
+	bestJ={}
+	bestI={}
+
+	# dice computation for each point (i,j)
+	for i in range(lenSents1):
+		nb1=max(1,len(sents1[i])-n+1)
+		if verbose and i%100==0:
+			print ("x =",i,"/",lenSents1)
+		# computing the number of common ngrams (based on occurrences and not on type)
+		# only for the sentences j that share at least one ngram with sentence i
+		if diagWidth:
+			(low,high)=corridors[i]
+		else:
+			(low,high)=lengthWindow(nb1)
+		nbCommonJ={}
+		for ngram,count1 in ngrams1[i].items():
+			if ngram in index2:
+				(postingKeys,postings)=index2[ngram]
+				for k in range(bisect.bisect_left(postingKeys,low),bisect.bisect_right(postingKeys,high)):
+					(j,count2)=postings[k]
+					if j not in nbCommonJ:
+						nbCommonJ[j]=0
+					nbCommonJ[j]+=min(count1,count2)
+		if diceThreshold>=0:
+			# a pair without any common ngram has a null dice and cannot yield a candidate point
+			columns=sorted(nbCommonJ.keys())
+		elif diagWidth:
+			# all the pairs of the corridor are candidates
+			columns=range(low,high+1)
+		else:
+			# all the pairs are candidates, in the window of the comparable lengths
+			columns=sorted(sortedJ[bisect.bisect_left(sortedNbs2,low):bisect.bisect_right(sortedNbs2,high)])
+		for j in columns:
+			nb2=max(1,len(sents2[j])-n+1)
+			# length of sent1 and sent2 must be comparable
+			if nb1>minSentLength and nb2>minSentLength and nb1/nb2 >= minSentLengthRatio and nb2/nb1 >=minSentLengthRatio:
+				nbCommon=nbCommonJ.get(j,0)
+				dice=2*nbCommon/(nb1+nb2)
+				# if dice is greater than the threshold, candidate point (i,j) is recorded
+				if dice>diceThreshold:
+					if not j in bestI.keys():
+						bestI[j]=[]
+					if not i in bestJ.keys():
+						bestJ[i]=[]
+					bestI[j].append((dice,i))
+					bestJ[i].append((dice,j))
+	return (bestJ,bestI)
+
+# encoding of a list of ngram profiles as a sparse count matrix (one line per sentence, one column per ngram of the sorted vocabulary)
+def ngramMatrix(ngrams,vocabulary):
+	rows=np.repeat(np.arange(len(ngrams),dtype=np.int64),[len(profile) for profile in ngrams])
+	if len(rows)==0:
+		return (rows,rows,np.zeros(0,dtype=np.int32))
+	cols=np.searchsorted(vocabulary,np.concatenate([profile.codes for profile in ngrams])).astype(np.int64)
+	counts=np.concatenate([profile.counts for profile in ngrams]).astype(np.int32)
+	return (rows,cols,counts)
+
+# selection of the entries that are among the k best of their line : entries must be sorted by line then column,
+# and ties are broken by column order, as a stable sort on the dice would do
+def kBestMask(rows,cols,dice,nbRows,nbCols):
+	selected=np.zeros(len(dice),dtype=bool)
+	# lines are processed by blocks, in order to limit the size of the dense dice matrix
+	blockHeight=max(1,denseBlockSize//max(1,nbCols))
+	for r0 in range(0,nbRows,blockHeight):
+		r1=min(nbRows,r0+blockHeight)
+		(e0,e1)=np.searchsorted(rows,[r0,r1])
+		if e0==e1:
+			continue
+		blockRows=rows[e0:e1]-r0
+		blockDice=dice[e0:e1]
+		if nbCols>kBest:
+			# the k-th best dice of each line (-1 when the line has less than k candidates)
+			block=np.full((r1-r0,nbCols),-1.0)
+			block[blockRows,cols[e0:e1]]=blockDice
+			kth=np.argpartition(-block,kBest-1,axis=1)[:,kBest-1]
+			kthDice=block[np.arange(r1-r0),kth]
+		else:
+			kthDice=np.full(r1-r0,-1.0)
+		greater=blockDice>kthDice[blockRows]
+		equal=blockDice==kthDice[blockRows]
+		# the entries equal to the k-th dice are taken in column order until k entries are selected
+		nbGreater=np.bincount(blockRows[greater],minlength=r1-r0)
+		equalCount=np.cumsum(equal)
+		firstOfRow=np.searchsorted(blockRows,blockRows)
+		equalRank=equalCount-np.concatenate(([0],equalCount))[firstOfRow]
+		selected[e0:e1]=greater | (equal & (equalRank <= kBest-nbGreater[blockRows]))
+	return selected
+
+# vectorized dice computation (numpy engine) with sparse count matrices built over a shared ngram vocabulary
+# returns the same candidate lists as diceCandidates, restricted to the k best coordinates
+def diceCandidatesNumpy(ngrams1,ngrams2,sents1,sents2):
+	lenSents1=len(sents1)
+	lenSents2=len(sents2)
+	bestJ={}
+	bestI={}
+	if kBest<1:
+		return (bestJ,bestI)
+	
+	vocabulary=np.unique(np.concatenate([profile.codes for profile in ngrams1+ngrams2]+[np.zeros(0,dtype=np.uint64)]))
+	(rows1,cols1,counts1)=ngramMatrix(ngrams1,vocabulary)
+	(rows2,cols2,counts2)=ngramMatrix(ngrams2,vocabulary)
+	if len(counts1)==0 or len(counts2)==0:
+		return (bestJ,bestI)
+	
+	# the number of common ngrams (based on occurrences) is the sum of min(count1,count2), which is computed
+	# as the sum, for each level t, of the products of the binary matrices [count1>=t] and [count2>=t]
+	common=scipy.sparse.csr_matrix((lenSents1,lenSents2),dtype=np.int32)
+	for level in range(1,min(counts1.max(),counts2.max())+1):
+		keep1=counts1>=level
+		keep2=counts2>=level
+		matrix1=scipy.sparse.csr_matrix((np.ones(keep1.sum(),dtype=np.int32),(rows1[keep1],cols1[keep1])),shape=(lenSents1,len(vocabulary)))
+		matrix2=scipy.sparse.csr_matrix((np.ones(keep2.sum(),dtype=np.int32),(rows2[keep2],cols2[keep2])),shape=(lenSents2,len(vocabulary)))
+		common=common+matrix1@matrix2.T
+	common=common.tocoo()
+	
+	# entries sorted by line and column
+	order=np.lexsort((common.col,common.row))
+	rows=common.row[order].astype(np.int64)
+	cols=common.col[order].astype(np.int64)
+	nbCommon=common.data[order]
+	
+	# length of sent1 and sent2 must be comparable, and dice must be greater than the threshold
+	nb1=np.maximum(1,np.array([len(sent) for sent in sents1],dtype=np.int64)-n+1)[rows]
+	nb2=np.maximum(1,np.array([len(sent) for sent in sents2],dtype=np.int64)-n+1)[cols]
+	dice=2*nbCommon/(nb1+nb2)
+	mask=(nb1>minSentLength) & (nb2>minSentLength) & (nb1/nb2>=minSentLengthRatio) & (nb2/nb1>=minSentLengthRatio) & (dice>diceThreshold)
+	rows=rows[mask]
+	cols=cols[mask]
+	dice=dice[mask]
+	
+	# k best j for each i
+	selected=kBestMask(rows,cols,dice,lenSents1,lenSents2)
+	for (i,j,d) in zip(rows[selected].tolist(),cols[selected].tolist(),dice[selected].tolist()):
+		if not i in bestJ.keys():
+			bestJ[i]=[]
+		bestJ[i].append((d,j))
+	
+	# k best i for each j
+	order=np.lexsort((rows,cols))
+	selected=kBestMask(cols[order],rows[order],dice[order],lenSents2,lenSents1)
+	for (j,i,d) in zip(cols[order][selected].tolist(),rows[order][selected].tolist(),dice[order][selected].tolist()):
+		if not j in bestI.keys():
+			bestI[j]=[]
+		bestI[j].append((d,i))
+	
+	return (bestJ,bestI)
+
+# measures of the benchmark : time spent in each stage and numbers of sentences, summed over the file pairs
+stages=('reading','ngrams','dice','candidates','density','conflicts','intervals','output')
+measures={}
+
+# adds the time spent since t to a stage, and returns the current time
+def endStage(stage,t):
+	now=time.perf_counter()
+	measures[stage]=measures.get(stage,0)+now-t
+	return now
+
+def addMeasures(pairMeasures):
+	for (key,value) in pairMeasures.items():
+		measures[key]=measures.get(key,0)+value
+
+# serialization of an output file : yields the parts of the file (header, sentences of the intervals (k1,k2) of one side, footer),
+# in the output format, so that the writers write them sentence by sentence
+def serialize(sents,idSents,intervals):
+	if outputFormat=="ces":
+		yield cesHeader
+	elif outputFormat=="arc":
+		yield arcHeader
+	for (k1,k2) in intervals:
+		for k in range(k1,k2+1):
+			if outputFormat=="ces" or outputFormat=="arc":
+				if inputFormat=="ces" or outputFormat=="arc":
+					idSent=idSents[k]
+				else:
+					idSent=str(k+1)
+				yield "<s id=\""+idSent+"\">\n"+sents[k]+"\n</s>\n"
+			else :
+				yield sents[k]+"\n"
+	if outputFormat=="ces" or outputFormat=="arc":
+		yield cesFooter
+
+# output writers : write(fileName,parts) writes an output file part by part (see serialize()), close() ends the output
+
+# the files are written in the output directory
+class DirectoryWriter:
+	def __init__(self,directory):
+		self.directory=directory
+
+	def write(self,fileName,parts):
+		os.makedirs(self.directory,exist_ok=True)
+		with open(os.path.join(self.directory,fileName),mode="w",encoding="utf8") as output:
+			for part in parts:
+				output.write(part)
+
+	def close(self):
+		pass
+
+# the files are written in temporary files (in the worker processes, the files of the archive are sent to the main process
+# by their paths, see ArchiveWriter.writeFile())
+class TemporaryWriter:
+	def __init__(self):
+		self.files=[]
+
+	def write(self,fileName,parts):
+		(handle,path)=tempfile.mkstemp(prefix='alignable.')
+		with open(handle,mode="w",encoding="utf8") as output:
+			for part in parts:
+				output.write(part)
+		self.files.append((fileName,path))
+
+	def close(self):
+		pass
+
+# the files are written in a single zip or tar archive, whose compression is given by the extension
+# the size of a tar member is written before its data : the file is spooled first (on disk above spoolSize bytes)
+class ArchiveWriter:
+	spoolSize=1024*1024
+
+	def __init__(self,fileName):
+		self.zip=None
+		self.tar=None
+		self.stream=None
+		if fileName.endswith('.zip'):
+			self.zip=zipfile.ZipFile(fileName,mode='w',compression=zipfile.ZIP_DEFLATED)
+		elif fileName.endswith('.tar.zst'):
+			if zstandard is None:
+				raise ValueError("The .tar.zst archives require the zstandard module: "+fileName)
+			self.stream=zstandard.ZstdCompressor().stream_writer(open(fileName,mode='wb'))
+			self.tar=tarfile.open(fileobj=self.stream,mode='w|')
+		else:
+			compressions={'.tar':'','.tar.gz':'gz','.tgz':'gz','.tar.bz2':'bz2','.tar.xz':'xz'}
+			extensions=[extension for extension in compressions.keys() if fileName.endswith(extension)]
+			if not extensions:
+				raise ValueError("Unknown archive format: "+fileName)
+			self.tar=tarfile.open(fileName,mode='w:'+compressions[extensions[0]])
+
+	def write(self,fileName,parts):
+		if self.zip is not None:
+			with self.zip.open(fileName,mode='w') as output:
+				for part in parts:
+					output.write(part.encode('utf8'))
+		else:
+			with tempfile.SpooledTemporaryFile(max_size=self.spoolSize) as data:
+				for part in parts:
+					data.write(part.encode('utf8'))
+				self.add(fileName,data)
+
+	# adds a file written by a TemporaryWriter, which is removed
+	def writeFile(self,fileName,path):
+		with open(path,mode='rb') as data:
+			if self.zip is not None:
+				with self.zip.open(fileName,mode='w') as output:
+					shutil.copyfileobj(data,output)
+			else:
+				self.add(fileName,data)
+		os.remove(path)
+
+	# adds the content of the binary file data to the tar archive
+	def add(self,fileName,data):
+		info=tarfile.TarInfo(fileName)
+		info.size=data.seek(0,io.SEEK_END)
+		info.mtime=int(time.time())
+		data.seek(0)
+		self.tar.addfile(info,data)
+
+	def close(self):
+		if self.zip is not None:
+			self.zip.close()
+		else:
+			self.tar.close()
+		if self.stream is not None:
+			self.stream.close()
+
+# processing of an aligned file pair : returns the status of the pair ("aligned", "no interval" or "no point")
+def processFilePair(file1,writer):
+	t=time.perf_counter()
+	m=filePattern.match(file1)
+	name=m.group(1)
+	file2=name+"."+l2+"."+inputFormat
+	if verbose: 
+		print("Processing",file1,"and",file2)
+	f1=open(os.path.join(inputDir,file1),encoding='utf8')
+	f2=open(os.path.join(inputDir,file2),encoding='utf8')
+	sents1=[]
+	sents2=[]
+	idSents1=[]
+	idSents2=[]
+	lenSents1=0
+	lenSents2=0
+	if inputFormat=="arc" or inputFormat=="ces":
+		sentId=""
+		for line in f1:
+			line=line.strip()
+			m=re.search(r'<s\s+id="([^"]*)"',line)
+			if m:
+				sentId=m.group(1)
+			elif sentId!="":
+				idSents1.append(sentId)
+				sents1.append(line)
+				lenSents1+=1
+				sentId=""
+		for line in f2:
+			line=line.strip()
+			m=re.search(r'<s\s+id="([^"]*)"',line)
+			if m:
+				sentId=m.group(1)
+			elif sentId!="":
+				idSents2.append(sentId)
+				sents2.append(line)
+				lenSents2+=1
+				sentId=""
+	else:
+		for line in f1:
+			line=line.strip()
+			sents1.append(line)
+			lenSents1+=1
+		for line in f2:
+			line=line.strip()
+			sents2.append(line)
+			lenSents2+=1
+
+	addMeasures({'sentences1':lenSents1,'sentences2':lenSents2})
+	t=endStage('reading',t)
+
+	# extracting the ngram profiles of sents1 and sents2
+	(ngrams1,ngrams2)=ngramProfiles(sents1,sents2)
+	t=endStage('ngrams',t)
+
+	# dice computation
+	if engine=="numpy" and np is not None and not diagWidth and diceThreshold>=0:
+		(bestJ,bestI)=diceCandidatesNumpy(ngrams1,ngrams2,sents1,sents2)
+	else:
+		(bestJ,bestI)=diceCandidates(ngrams1,ngrams2,sents1,sents2)
+	t=endStage('dice',t)
+
+	# building the point list taking, for each coordinate, the k best corresponding point
+	x=[]
+	y=[]
+	points={} # points are recorded here as keys
+	for i in bestJ.keys():
+		# sorting the candidate according to dice
+		bestJ[i]=sorted(bestJ[i],key = lambda x:x[0],reverse=True)
+		# only the k best are recorded
+		bestJ[i]=[bestJ[i][l][1] for l in range(0,min(kBest,len(bestJ[i])))]
+		
+	for j in bestI.keys():
+		# sorting the candidate according to dice
+		bestI[j]=sorted(bestI[j],key = lambda x:x[0],reverse=True)
+		# only the k best are recorded
+		bestI[j]=[bestI[j][l][1] for l in range(0,min(kBest,len(bestI[j])))]
+	
+	for i in bestJ.keys():	
+		for j in bestJ[i]:
+			if i in bestI[j]:
+				x.append(i)
+				y.append(j)
+				points[(i,j)]=1
+	t=endStage('candidates',t)
+
+	# compute average local density around selected points
+	pointsKey=list(points.keys())
+	if len(pointsKey)==0:
+		return "no point"
+	diagonals=buildDiagonals(points)
+
+	totDensity=0
+	for point in pointsKey:
+		(i,j)=point
+		totDensity+= computeLocalDensity(i,j,diagonals,lenSents1,lenSents2)
+	
+	averageDensity=totDensity/float(len(pointsKey))
 
 
+	# filtering
+	(x_filtered,y_filtered)=filterPoints(points,diagonals,lenSents1,lenSents2,averageDensity)
+	t=endStage('density',t)
+	(x_filtered,y_filtered)=resolvingConflicts(points,diagonals,lenSents1,lenSents2)
+	t=endStage('conflicts',t)
+	
+	# finding aligning interval
+	beginInt=(0,0)
+	lastI=0
+	lastJ=0
+	intervals=[] # the array of pairs (beginInt,endInt) where beginInt and endInd are two points that define the interval
+	nbInInterval=0
+	totalIntervalLength=0
+	lastDensity=computeLocalDensity(0,0,diagonals,lenSents1,lenSents2)
+	for num in range(0,len(x_filtered)):
+		(i,j)=(x_filtered[num],y_filtered[num])
+		print(i,j)
+		density=computeLocalDensity(i,j,diagonals,lenSents1,lenSents2)
+		# computation of the distance between (i,j) and (i,expected(j)) 
+		expectedJ=lastJ+(i-lastI)
+		dist=abs(j-expectedJ)
+
+		# only the points that are near the diagonal are taken into account
+		if dist <= maxDistToTheDiagonal:
+			nbInInterval+=1
+		else:
+			print("not in Interval. Density",density,"last density",lastDensity)
+			# anomalous points are not taken into account in the interval computation
+			if lastDensity> 0 and density/lastDensity<0.5:
+				continue
+			
+		# computing distance
+		d=math.sqrt((i-lastI)**2+(j-lastJ)**2)
+		# if a there is a gap, the previous interval is closed and a new interval will begin
+		if d>maxGapSize:
+			print("maxGapSize")
+			endInt=(lastI,lastJ)
+			if beginInt[0]<lastI and beginInt[1]<lastJ:
+				# to save the interval, we compute the density of selected points according to the horizontal width
+				if nbInInterval/(lastI - beginInt[0]) >= minHorizontalDensity and nbInInterval>1:
+					intervals.append((beginInt,endInt))
+					totalIntervalLength+=lastI - beginInt[0]
+				else:
+					if verbose:
+						print("Interval",beginInt,endInt,"has been discarded (density too low)")
+			beginInt=(i,j)
+			nbInInterval=0
+		lastI=i
+		lastJ=j
+		lastDensity=density
+	
+	if lastI!=beginInt[0]:
+		intervals.append((beginInt,(lastI,lastJ)))
+		totalIntervalLength+=lastI - beginInt[0]
+
+	if verbose:
+		print("Total interval length=",totalIntervalLength)
+	t=endStage('intervals',t)
+	# display of the points : eliminated points are red
+	if printPlot:
+		plt.axis([1,lenSents1,1,lenSents2])
+		plt.title(name+'.'+l1+'-'+l2+'.txt - filtered')
+		plt.scatter(x,y,c="red",s=1)
+		plt.scatter(x_filtered,y_filtered,c="black",s=1)
+		for interval in intervals:
+			(i1,j1)=interval[0]
+			(i2,j2)=interval[1]
+			x=[i1,i1,i2,i2,i1]
+			y=[j1,j2,j2,j1,j1]
+			plt.plot(x,y,c="grey")
+		plt.show()
+		plt.close()
+		t=time.perf_counter()
+	
+	# writing output files
+	if len(intervals)>0:
+		writer.write(name+"."+l1+"."+outputFormat,serialize(sents1,idSents1,[(i1,i2) for ((i1,j1),(i2,j2)) in intervals]))
+		writer.write(name+"."+l2+"."+outputFormat,serialize(sents2,idSents2,[(j1,j2) for ((i1,j1),(i2,j2)) in intervals]))
+		endStage('output',t)
+		return "aligned"
+	return "no interval"
+
+# processing of an aligned file pair, with the same error policy in the workers and in the main process :
+# an exception is printed and gives the status "error", and the next pairs are processed
+def tryFilePair(file1,writer):
+	try:
+		return processFilePair(file1,writer)
+	except Exception:
+		traceback.print_exc(file=sys.stdout)
+		return "error"
+
+# processing of an aligned file pair in a worker process : the messages are recorded
+# in order to be printed whole, and not interleaved with the messages of the other pairs
+# the output files of an archive are returned (paths of temporary files), to be written by the main process, with the measures of the benchmark
+def processFilePairInWorker(file1):
+	measures.clear()
+	messages=io.StringIO()
+	writer=TemporaryWriter() if archive else DirectoryWriter(outputDir)
+	with contextlib.redirect_stdout(messages):
+		status=tryFilePair(file1,writer)
+	return (file1,status,messages.getvalue(),writer.files if archive else [],dict(measures))
+
 #************************************************************************* MAIN
 
 if __name__ == "__main__":
 	t0=time.monotonic()
 	
-	# reading aligned files
+	if engine=="numpy" and np is None:
+		print("The numpy engine requires numpy and scipy : using the python engine")
+	if jobs>1 and printPlot:
+		print("The plots are shown one after the other : -j is ignored with -p")
+	
+	# listing aligned files
+	files1=[]
 	for file1 in os.listdir(inputDir):
 		m=filePattern.match(file1)
 		if m and re.search(l1+"."+inputFormat,file1,re.I):
-			# processing of an aligned file pair
-			name=m.group(1)
-			file2=name+"."+l2+"."+inputFormat
-			if verbose: 
-				print("Processing",file1,"and",file2)
-			f1=open(os.path.join(inputDir,file1),encoding='utf8')
-			f2=open(os.path.join(inputDir,file2),encoding='utf8')
-			sents1=[]
-			sents2=[]
-			idSents1=[]
-			idSents2=[]
-			lenSents1=0
-			lenSents2=0
-			if inputFormat=="arc" or inputFormat=="ces":
-				sentId=""
-				for line in f1:
-					line=line.strip()
-					m=re.search(r'<s\s+id="([^"]*)"',line)
-					if m:
-						sentId=m.group(1)
-					elif sentId!="":
-						idSents1.append(sentId)
-						sents1.append(line)
-						lenSents1+=1
-						sentId=""
-				for line in f2:
-					line=line.strip()
-					m=re.search(r'<s\s+id="([^"]*)"',line)
-					if m:
-						sentId=m.group(1)
-					elif sentId!="":
-						idSents2.append(sentId)
-						sents2.append(line)
-						lenSents2+=1
-						sentId=""
-			else:
-				for line in f1:
-					line=line.strip()
-					sents1.append(line)
-					lenSents1+=1
-				for line in f2:
-					line=line.strip()
-					sents2.append(line)
-					lenSents2+=1
-
-			# extracting hash table that records all the ngrams for sents1
-			ngrams1=[]
-			for i in range(lenSents1):
-				ngrams1.append({})
-				sent1=sents1[i]
-				for k in range(0,len(sent1)-n):
-					ngram=sent1[k:k+n]
-					if valid(ngram):
-						if ngram not in ngrams1[i].keys() :
-							ngrams1[i][ngram]=0
-						ngrams1[i][ngram]+=1
-
-			# extracting hash table that records all the ngrams for sents2
-			ngrams2=[]
-			for j in range(lenSents2):
-				sent2=sents2[j]
-				ngrams2.append({})
-				for k in range(0,len(sent2)-n):
-					ngram=sent2[k:k+n]
-					if valid(ngram):
-						if ngram not in ngrams2[j].keys():
-							ngrams2[j][ngram]=0
-						ngrams2[j][ngram]+=1
-			
-			# record the corresponding coordinate, sorted according to dice
-			bestJ={}
-			bestI={}
-
-			# 
-			if diagWidth:
-				range2=diagWidth
-			else : 
-				range2=lenSents2
-			# dice computation for each point (i,j)
-			for i in range(lenSents1):
-				nb1=max(1,len(sents1[i])-n+1)
-				if verbose and i%100==0:
-					print ("x =",i,"/",lenSents1)
-				for J in range(range2):
-					if diagWidth:
-						# when using fixed vertical width around diag, j must be computed as: int(i*lenSents2/lenSents1-range2/2)
-						j=int(i*lenSents2/lenSents1-range2/2)
-					else:
-						j=J
-					if j<0:
-						continue
-					nb2=max(1,len(sents2[j])-n+1)
-					# length of sent1 and sent2 must be comparable
-					if nb1>minSentLength and nb2>minSentLength and nb1/nb2 >= minSentLengthRatio and nb2/nb1 >=minSentLengthRatio:
-						# computing the number of common ngrams (based on occurrences and not on type)
-						nbCommon=0
-						for ngram in ngrams1[i].keys():
-							if ngram in ngrams2[j].keys():
-								nbCommon+=min(ngrams1[i][ngram],ngrams2[j][ngram])
-						dice=2*nbCommon/(nb1+nb2)
-						# if dice is greater than the threshold, candidate point (i,j) is recorded
-						if dice>diceThreshold:
-							if not j in bestI.keys():
-								bestI[j]=[]
-							if not i in bestJ.keys():
-								bestJ[i]=[]
-							bestI[j].append((dice,i))
-							bestJ[i].append((dice,j))
-
-			# building the point list taking, for each coordinate, the k best corresponding point
-			x=[]
-			y=[]
-			points={} # points are recorded here as keys
-			for i in bestJ.keys():
-				# sorting the candidate according to dice
-				bestJ[i]=sorted(bestJ[i],key = lambda x:x[0],reverse=True)
-				# only the k best are recorded
-				bestJ[i]=[bestJ[i][l][1] for l in range(0,min(kBest,len(bestJ[i])))]
-				
-			for j in bestI.keys():
-				# sorting the candidate according to dice
-				bestI[j]=sorted(bestI[j],key = lambda x:x[0],reverse=True)
-				# only the k best are recorded
-				bestI[j]=[bestI[j][l][1] for l in range(0,min(kBest,len(bestI[j])))]
-			
-			for i in bestJ.keys():	
-				for j in bestJ[i]:
-					if i in bestI[j]:
-						x.append(i)
-						y.append(j)
-						points[(i,j)]=1
-
-			# compute average local density around selected points
-			pointsKey=list(points.keys())
-			if len(pointsKey)==0:
-				continue
-
-			totDensity=0
-			for point in pointsKey:
-				(i,j)=point
-				totDensity+= computeLocalDensity(i,j,points,lenSents1,lenSents2)
-			
-			averageDensity=totDensity/float(len(pointsKey))
-		
-		
-			# filtering
-			(x_filtered,y_filtered)=filterPoints(points,lenSents1,lenSents2,averageDensity)
-			(x_filtered,y_filtered)=resolvingConflicts(points,lenSents1,lenSents2)
-			
-			# finding aligning interval
-			beginInt=(0,0)
-			lastI=0
-			lastJ=0
-			intervals=[] # the array of pairs (beginInt,endInt) where beginInt and endInd are two points that define the interval
-			nbInInterval=0
-			totalIntervalLength=0
-			lastDensity=computeLocalDensity(0,0,points,lenSents1,lenSents2)
-			for num in range(0,len(x_filtered)):
-				(i,j)=(x_filtered[num],y_filtered[num])
-				print(i,j)
-				density=computeLocalDensity(i,j,points,lenSents1,lenSents2)
-				# computation of the distance between (i,j) and (i,expected(j)) 
-				expectedJ=lastJ+(i-lastI)
-				dist=abs(j-expectedJ)
-
-				# only the points that are near the diagonal are taken into account
-				if dist <= maxDistToTheDiagonal:
-					nbInInterval+=1
-				else:
-					print("not in Interval. Density",density,"last density",lastDensity)
-					# anomalous points are not taken into account in the interval computation
-					if lastDensity> 0 and density/lastDensity<0.5:
-						continue
-					
-				# computing distance
-				d=math.sqrt((i-lastI)**2+(j-lastJ)**2)
-				# if a there is a gap, the previous interval is closed and a new interval will begin
-				if d>maxGapSize:
-					print("maxGapSize")
-					endInt=(lastI,lastJ)
-					if beginInt[0]<lastI and beginInt[1]<lastJ:
-						# to save the interval, we compute the density of selected points according to the horizontal width
-						if nbInInterval/(lastI - beginInt[0]) >= minHorizontalDensity and nbInInterval>1:
-							intervals.append((beginInt,endInt))
-							totalIntervalLength+=lastI - beginInt[0]
-						else:
-							if verbose:
-								print("Interval",beginInt,endInt,"has been discarded (density too low)")
-					beginInt=(i,j)
-					nbInInterval=0
-				lastI=i
-				lastJ=j
-				lastDensity=density
-			
-			if lastI!=beginInt[0]:
-				intervals.append((beginInt,(lastI,lastJ)))
-				totalIntervalLength+=lastI - beginInt[0]
-
-			if verbose:
-				print("Total interval length=",totalIntervalLength)
-			# display of the points : eliminated points are red
-			if printPlot:
-				plt.axis([1,lenSents1,1,lenSents2])
-				plt.title(name+'.'+l1+'-'+l2+'.txt - filtered')
-				plt.scatter(x,y,c="red",s=1)
-				plt.scatter(x_filtered,y_filtered,c="black",s=1)
-				for interval in intervals:
-					(i1,j1)=interval[0]
-					(i2,j2)=interval[1]
-					x=[i1,i1,i2,i2,i1]
-					y=[j1,j2,j2,j1,j1]
-					plt.plot(x,y,c="grey")
-				plt.show()
-				plt.close()
-			
-			# writing output files
-			if len(intervals)>0:
-				if not os.path.exists(outputDir):
-					os.mkdir(outputDir)
-				output1=open(os.path.join(outputDir,name+"."+l1+"."+outputFormat),mode="w",encoding="utf8")
-				output2=open(os.path.join(outputDir,name+"."+l2+"."+outputFormat),mode="w",encoding="utf8")
-			
-				# output header
-				if outputFormat=="ces":
-					output1.write(cesHeader)
-					output2.write(cesHeader)
-				elif outputFormat=="arc":
-					output1.write(arcHeader)
-					output2.write(arcHeader)
-					
-				# output sentences
-				for interval in intervals:
-					(i1,j1)=interval[0]
-					(i2,j2)=interval[1]
-					
-					for i in range(i1,i2+1):
-						if outputFormat=="ces" or outputFormat=="arc":
-							if inputFormat=="ces" or outputFormat=="arc":
-								idSent=idSents1[i]
-							else:
-								idSent=str(i+1)
-							output1.write("<s id=\""+idSent+"\">\n"+sents1[i]+"\n</s>\n")
-						else :
-							output1.write(sents1[i]+"\n")
-					for j in range(j1,j2+1):
-						if outputFormat=="ces" or outputFormat=="arc":
-							if inputFormat=="ces" or outputFormat=="arc":
-								idSent=idSents2[j]
-							else:
-								idSent=str(j+1)
-							output2.write("<s id=\""+idSent+"\">\n"+sents2[j]+"\n</s>\n")
-						else :
-							output2.write(sents2[j]+"\n")
-				
-				# output footer
-				if outputFormat=="ces":
-					output1.write(cesFooter)
-					output2.write(cesFooter)
-				elif outputFormat=="arc":
-					output1.write(cesFooter)
-					output2.write(cesFooter)
-				
-				output1.close()
-				output2.close()
-				
+			files1.append(file1)
+	
+	# processing of each aligned file pair
+	statusCount={}
+	writer=ArchiveWriter(archive) if archive else DirectoryWriter(outputDir)
+	if jobs>1 and not printPlot:
+		with multiprocessing.Pool(jobs) as pool:
+			for (file1,status,messages,files,pairMeasures) in pool.imap_unordered(processFilePairInWorker,files1):
+				print(messages,end="")
+				addMeasures(pairMeasures)
+				if status=="error":
+					print("Error while processing",file1)
+				for (fileName,path) in files:
+					writer.writeFile(fileName,path)
+				statusCount[status]=statusCount.get(status,0)+1
+	else:
+		for file1 in files1:
+			status=tryFilePair(file1,writer)
+			if status=="error":
+				print("Error while processing",file1)
+			statusCount[status]=statusCount.get(status,0)+1
+	writer.close()
+	
+	# summary
+	print(len(files1),"file pairs processed :",", ".join(str(statusCount[status])+" "+status for status in sorted(statusCount.keys())))
 	if 	verbose:
-		print ("Terminated in",time.monotonic()-t0,"s.")				
+		print ("Terminated in",time.monotonic()-t0,"s.")
+	
+	# benchmark report (the number of sentence pairs is the mean of the numbers of sentences of both sides)
+	if benchmarkFile:
+		totalTime=time.monotonic()-t0
+		nbSentencePairs=(measures.get('sentences1',0)+measures.get('sentences2',0))/2
+		peakMemory=max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+		report={
+			'parameters':vars(args),
+			'filePairs':len(files1),
+			'status':statusCount,
+			'sentences1':measures.get('sentences1',0),
+			'sentences2':measures.get('sentences2',0),
+			'stages':{stage:measures.get(stage,0) for stage in stages},
+			'totalTime':totalTime,
+			'sentencePairsPerSecond':nbSentencePairs/totalTime if totalTime>0 else 0,
+			'peakMemoryKB':peakMemory,
+		}
+		with open(benchmarkFile,mode="w",encoding="utf8") as output:
+			json.dump(report,output,indent=1)				
@@ -0,0 +1,181 @@
+# -*- coding:utf8 -*-
+
+"""
+Benchmark of alignable.py on a synthetic parallel corpus
+
+The corpus is made of file pairs NAME.L1.txt NAME.L2.txt (one sentence per line) : the sentences of L1 are random
+sequences of pseudo-words, and the sentences of L2 are their noisy copies (characters and words substituted),
+with non parallel sentences inserted, sentences deleted and neighbour sentences swapped.
+alignable.py is run on the corpus with --benchmark, and its report (time of each stage, throughput and peak memory)
+is saved in a JSON file, with the corpus parameters and the git revision, in order to compare versions offline.
+
+Usage :
+	python3 benchmark.py OUTPUT.json [--docs 10] [--sentences 500] [--noise 0.15] [--insertions 0.1] [--deletions 0.05]
+		[--reorderings 0.02] [--seed 1] [--runs 1] [ALIGNABLE OPTIONS]
+	python3 benchmark.py --generate DIRECTORY [corpus options]
+	python3 benchmark.py --compare OLD.json NEW.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+scriptDir=os.path.dirname(os.path.abspath(__file__))
+
+syllables=['a','ka','to','ri','men','sa','lo','pe','du','an','vi','or','el','ne','ba','gu','chi','ta','mo','re','il','ost','un','de','fra']
+letters="abcdefghijklmnopqrstuvwxyz"
+vocabularySize=5000
+minSentLength=3		# min number of words of a sentence
+maxSentLength=30	# max number of words of a sentence
+numberRate=0.05		# rate of the words that are numbers
+
+
+class CorpusGenerator:
+	def __init__(self,seed=1,noise=0.15,insertions=0.1,deletions=0.05,reorderings=0.02):
+		self.random=random.Random(seed)
+		self.noise=noise
+		self.insertions=insertions
+		self.deletions=deletions
+		self.reorderings=reorderings
+		self.vocabulary=[self.word() for k in range(vocabularySize)]
+		# zipfian distribution of the words
+		self.weights=[1/(k+1) for k in range(vocabularySize)]
+
+	def word(self):
+		return "".join(self.random.choice(syllables) for k in range(self.random.randint(1,4)))
+
+	def sentence(self):
+		words=[]
+		for word in self.random.choices(self.vocabulary,self.weights,k=self.random.randint(minSentLength,maxSentLength)):
+			if self.random.random()<numberRate:
+				word=str(self.random.randint(1,3000))
+			words.append(word)
+		return " ".join(words).capitalize()+"."
+
+	# the translation is a noisy copy : words are replaced by other words, and characters by other letters
+	def translate(self,sentence):
+		words=[]
+		for word in sentence.split(" "):
+			if self.random.random()<self.noise:
+				word=self.random.choices(self.vocabulary,self.weights)[0]
+			words.append("".join(self.random.choice(letters) if self.random.random()<self.noise else char for char in word))
+		return " ".join(words)
+
+	# returns the sentences of both sides of a document
+	def document(self,nbSentences):
+		sents1=[]
+		sents2=[]
+		for k in range(nbSentences):
+			sent1=self.sentence()
+			sents1.append(sent1)
+			if self.random.random()<self.insertions:
+				sents2.append(self.sentence())
+			if self.random.random()>=self.deletions:
+				sents2.append(self.translate(sent1))
+		for k in range(len(sents2)-1):
+			if self.random.random()<self.reorderings:
+				(sents2[k],sents2[k+1])=(sents2[k+1],sents2[k])
+		return (sents1,sents2)
+
+	def generate(self,directory,nbDocs,nbSentences,l1,l2):
+		os.makedirs(directory,exist_ok=True)
+		for doc in range(nbDocs):
+			(sents1,sents2)=self.document(nbSentences)
+			for (lang,sents) in ((l1,sents1),(l2,sents2)):
+				with open(os.path.join(directory,"doc%d.%s.txt"%(doc,lang)),mode="w",encoding="utf8") as output:
+					output.write("\n".join(sents)+"\n")
+
+
+# returns the git revision of the scripts, or None outside of a git repository
+def gitRevision():
+	try:
+		return subprocess.run(['git','rev-parse','HEAD'],cwd=scriptDir,capture_output=True,text=True,check=True).stdout.strip()
+	except (OSError,subprocess.CalledProcessError):
+		return None
+
+# runs alignable.py on the corpus of a directory : returns its benchmark report
+def runAlignable(inputDir,outputDir,reportFile,alignableArgs):
+	command=[sys.executable,os.path.join(scriptDir,'alignable.py'),'--inputDir',inputDir,'--outputDir',outputDir,'--benchmark',reportFile]+alignableArgs
+	subprocess.run(command,cwd=inputDir,check=True,stdout=subprocess.DEVNULL)
+	with open(reportFile,encoding="utf8") as report:
+		return json.load(report)
+
+def benchmark(args,alignableArgs):
+	corpus={key:getattr(args,key) for key in ('docs','sentences','noise','insertions','deletions','reorderings','seed')}
+	runs=[]
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inputDir=os.path.join(tmpDir,'input')
+		generator=CorpusGenerator(args.seed,args.noise,args.insertions,args.deletions,args.reorderings)
+		generator.generate(inputDir,args.docs,args.sentences,args.l1,args.l2)
+		for run in range(args.runs):
+			outputDir=os.path.join(tmpDir,'output%d'%run)
+			report=runAlignable(inputDir,outputDir,os.path.join(tmpDir,'report%d.json'%run),['--l1',args.l1,'--l2',args.l2]+alignableArgs)
+			runs.append(report)
+			print("Run",run+1,": %.2fs, %.1f sentence pairs/s, %d KB"%(report['totalTime'],report['sentencePairsPerSecond'],report['peakMemoryKB']))
+	# the best time of each stage over the runs
+	best={stage:min(report['stages'][stage] for report in runs) for stage in runs[0]['stages']}
+	result={
+		'date':time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'revision':gitRevision(),
+		'corpus':corpus,
+		'alignableArgs':alignableArgs,
+		'bestStages':best,
+		'bestTotalTime':min(report['totalTime'] for report in runs),
+		'runs':runs,
+	}
+	with open(args.output,mode="w",encoding="utf8") as output:
+		json.dump(result,output,indent=1)
+	printStages(best)
+
+def printStages(stages):
+	for (stage,duration) in stages.items():
+		print("%-12s %8.3fs"%(stage,duration))
+
+# comparison of the best times of two benchmark results
+def compare(oldFile,newFile):
+	with open(oldFile,encoding="utf8") as f:
+		old=json.load(f)
+	with open(newFile,encoding="utf8") as f:
+		new=json.load(f)
+	if old['corpus']!=new['corpus'] or old['alignableArgs']!=new['alignableArgs']:
+		print("Warning : the corpus or the options differ")
+	print("%-12s %9s %9s %7s"%("stage","old","new","ratio"))
+	rows=[(stage,old['bestStages'].get(stage,0),new['bestStages'].get(stage,0)) for stage in new['bestStages']]
+	rows.append(('total',old['bestTotalTime'],new['bestTotalTime']))
+	for (stage,oldTime,newTime) in rows:
+		ratio="%.2f"%(newTime/oldTime) if oldTime>0 else "-"
+		print("%-12s %8.3fs %8.3fs %7s"%(stage,oldTime,newTime,ratio))
+
+#**************************************************************** MAIN
+
+if __name__=="__main__":
+	parser=argparse.ArgumentParser(prog='benchmark',allow_abbrev=False,formatter_class=argparse.RawDescriptionHelpFormatter,description=__doc__)
+	parser.add_argument('output',nargs='?',help='The JSON file where the result is saved')
+	parser.add_argument('--generate',type=str,help='Only generates the corpus in the given directory',default='')
+	parser.add_argument('--compare',nargs=2,help='Compares two JSON results',metavar=('OLD','NEW'))
+	parser.add_argument('--docs',type=int,help='Number of file pairs',default=10)
+	parser.add_argument('--sentences',type=int,help='Number of sentences of each L1 file',default=500)
+	parser.add_argument('--noise',type=float,help='Rate of the substituted words and characters in the translations',default=0.15)
+	parser.add_argument('--insertions',type=float,help='Rate of the non parallel sentences inserted in L2',default=0.1)
+	parser.add_argument('--deletions',type=float,help='Rate of the L1 sentences without translation',default=0.05)
+	parser.add_argument('--reorderings',type=float,help='Rate of the swaps of neighbour L2 sentences',default=0.02)
+	parser.add_argument('--seed',type=int,help='Seed of the random generator',default=1)
+	parser.add_argument('--runs',type=int,help='Number of runs of alignable.py',default=1)
+	parser.add_argument('--l1',type=str,help='The source language',default='en')
+	parser.add_argument('--l2',type=str,help='The target language',default='fr')
+	# the unknown options are passed to alignable.py
+	(args,alignableArgs)=parser.parse_known_args()
+
+	if args.compare:
+		compare(args.compare[0],args.compare[1])
+	elif args.generate:
+		CorpusGenerator(args.seed,args.noise,args.insertions,args.deletions,args.reorderings).generate(args.generate,args.docs,args.sentences,args.l1,args.l2)
+	elif args.output:
+		benchmark(args,alignableArgs)
+	else:
+		parser.print_help()
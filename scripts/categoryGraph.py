@@ -0,0 +1,282 @@
+# -*- coding:utf8 -*-
+
+"""
+Category graph of a wikipedia : the parent categories (hidden categories excepted) of the articles and categories
+
+The parents of a title are read, by order of preference :
+	- in memory, then in the parents table (the parentCats table of the state file), where every result is recorded
+	- in the revision cache, shared by the languages
+	- with batched API queries (prop=categories), up to 50 titles per request
+The table can also be filled in one go from the local sql dumps (page, categorylinks and page_props), see loadDump().
+
+The distribution of the top categories reached from a category is computed once for each category and memoized,
+so that the top categories of an article are given by the distributions of its parents. The categories of a cycle
+are solved together (by strongly connected component), so that they are memoized as well.
+
+Usage :
+	graph=CategoryGraph(parentCats,pwSite,cache)
+	graph.prefetch(titles)
+	parents=graph.getParents(title)
+	distribution=graph.topDistribution(title,topCats,supraCats)
+"""
+
+import gzip
+import re
+import threading
+
+# pywikibot is only required for the API queries
+try:
+	from pywikibot.data import api
+except ImportError:
+	api=None
+
+batchSize=50 # max number of titles in an API query
+maxIterations=100 # max number of iterations of the weights in a cycle of categories
+convergence=1e-9 # max change of a weight between the last two iterations
+
+regexPage=re.compile(rb"\((\d+),(-?\d+),'((?:[^'\\]|\\.)*)'")
+regexCategoryLink=re.compile(rb"\((\d+),'((?:[^'\\]|\\.)*)'")
+regexHiddenCat=re.compile(rb"\((\d+),'hiddencat'")
+regexEscape=re.compile(rb"\\(.)")
+
+articleNs=0
+categoryNs=14
+
+
+class CategoryGraph:
+	def __init__(self,parents,pwSite=None,cache=None):
+		self.parents=parents
+		self.pwSite=pwSite
+		self.cache=cache
+		self.memory={}
+		self.distributions={}
+		self.lock=threading.RLock()
+		self.nbQueries=0
+		# when the table has been filled with the dumps, the titles that are not in the table have no category
+		self.complete='\tcomplete' in parents
+
+	# returns the parent categories of a title (the missing titles are fetched one by one)
+	def getParents(self,title):
+		with self.lock:
+			if title in self.memory:
+				return self.memory[title]
+			if title in self.parents:
+				self.memory[title]=self.parents[title]
+				return self.memory[title]
+		self.prefetch([title])
+		with self.lock:
+			return self.memory.get(title,[])
+
+	# loading the parents of a list of titles : the titles that are not known yet are queried by batches
+	def prefetch(self,titles):
+		missing=[]
+		with self.lock:
+			for title in titles:
+				if title in self.memory or title in missing:
+					continue
+				if title in self.parents:
+					self.memory[title]=self.parents[title]
+				else:
+					missing.append(title)
+		if self.cache is not None and self.pwSite is not None:
+			titles=missing
+			missing=[]
+			for title in titles:
+				cats=self.cache.get(('cats',self.pwSite.code,title))
+				if cats is None:
+					missing.append(title)
+				else:
+					self.record(title,cats)
+		if self.complete:
+			for title in missing:
+				self.record(title,self.parents.get(title.replace('_',' '),[]))
+			return
+		for i in range(0,len(missing),batchSize):
+			batch=missing[i:i+batchSize]
+			for (title,cats) in self.query(batch).items():
+				if self.cache is not None:
+					self.cache.put(('cats',self.pwSite.code,title),cats)
+				self.record(title,cats)
+
+	def record(self,title,cats):
+		with self.lock:
+			self.memory[title]=cats
+			self.parents[title]=cats
+
+	# API query of the categories of a batch of titles : returns a dict title -> list of the non hidden categories
+	def query(self,titles):
+		result={title:[] for title in titles}
+		# the titles are normalized by the API (e.g. underscores), the results are recorded with the requested titles
+		requested={title:title for title in titles}
+		parameters={'action':'query','prop':'categories','clprop':'hidden','cllimit':'max','titles':'|'.join(titles)}
+		while True:
+			with self.lock:
+				self.nbQueries+=1
+			data=api.Request(site=self.pwSite,parameters=parameters).submit()
+			query=data.get('query',{})
+			for normalized in query.get('normalized',[]):
+				requested[normalized['to']]=requested.get(normalized['from'],normalized['from'])
+			for page in query.get('pages',{}).values():
+				title=requested.get(page['title'],page['title'])
+				for cat in page.get('categories',[]):
+					if 'hidden' not in cat:
+						result.setdefault(title,[]).append(cat['title'])
+			# the categories of a page may be split between several answers
+			if 'continue' not in data:
+				break
+			parameters.update(data['continue'])
+		return result
+
+	# distribution of the top categories reached from a title : dict top category -> weight, the weights summing to 1 at most
+	# (the weight of a title is shared equally between its parents, the supra categories being ignored, and the weight that
+	# circulates in a cycle without reaching a top category is lost)
+	def topDistribution(self,title,topCats,supraCats):
+		self.prefetchAncestors(title,topCats,supraCats)
+		with self.lock:
+			return self.distribution(title,topCats,supraCats)
+
+	# loading, level by level, the ancestors of a title whose distribution is not known (up to the top categories)
+	def prefetchAncestors(self,title,topCats,supraCats):
+		seen=set([title])
+		level=[title]
+		while level:
+			level=[t for t in level if t not in self.distributions and t not in topCats]
+			self.prefetch(level)
+			nextLevel=[]
+			for t in level:
+				for parent in self.getParents(t):
+					if parent not in seen and parent not in supraCats:
+						seen.add(parent)
+						nextLevel.append(parent)
+			level=nextLevel
+
+	def ancestors(self,title,supraCats):
+		return [parent for parent in self.memory.get(title,[]) if parent not in supraCats]
+
+	# the distributions are computed by strongly connected components of the ancestors (Tarjan's algorithm, without recursion) :
+	# a component is solved once the components above it are known, and the distributions of all its titles are memoized,
+	# so that the result of a title does not depend on the order in which the titles are asked
+	def distribution(self,title,topCats,supraCats):
+		if title in topCats:
+			return {title:1}
+		if title in self.distributions:
+			return self.distributions[title]
+		index={title:0}
+		lowLink={title:0}
+		stack=[title]
+		onStack=set([title])
+		# path of the depth first search : (title, iterator on its parents)
+		path=[(title,iter(self.ancestors(title,supraCats)))]
+		while path:
+			(current,parents)=path[-1]
+			parent=next(parents,None)
+			if parent is not None:
+				if parent in topCats or parent in self.distributions:
+					continue
+				if parent not in index:
+					index[parent]=lowLink[parent]=len(index)
+					stack.append(parent)
+					onStack.add(parent)
+					path.append((parent,iter(self.ancestors(parent,supraCats))))
+				elif parent in onStack:
+					lowLink[current]=min(lowLink[current],index[parent])
+				continue
+			path.pop()
+			if path:
+				lowLink[path[-1][0]]=min(lowLink[path[-1][0]],lowLink[current])
+			if lowLink[current]==index[current]:
+				component=[]
+				while True:
+					member=stack.pop()
+					onStack.remove(member)
+					component.append(member)
+					if member==current:
+						break
+				self.solveComponent(component,topCats,supraCats)
+		return self.distributions[title]
+
+	# distributions of the titles of a component, whose parents outside the component are known : the weights that circulate
+	# inside the component are iterated until they are stable (maxIterations at most)
+	def solveComponent(self,component,topCats,supraCats):
+		component=sorted(component)
+		members=set(component)
+		outside={}
+		inside={}
+		for title in component:
+			parents=self.ancestors(title,supraCats)
+			outside[title]={}
+			inside[title]=[parent for parent in parents if parent in members]
+			for parent in parents:
+				if parent in members:
+					continue
+				known={parent:1} if parent in topCats else self.distributions[parent]
+				for (top,weight) in known.items():
+					outside[title][top]=outside[title].get(top,0)+weight/len(parents)
+		result={title:dict(outside[title]) for title in component}
+		if any(inside.values()):
+			for i in range(maxIterations):
+				change=0
+				for title in component:
+					nbParents=len(self.ancestors(title,supraCats))
+					distribution=dict(outside[title])
+					for parent in inside[title]:
+						for (top,weight) in result[parent].items():
+							distribution[top]=distribution.get(top,0)+weight/nbParents
+					change=max([change]+[abs(weight-result[title].get(top,0)) for (top,weight) in distribution.items()])
+					result[title]=distribution
+				if change<convergence:
+					break
+		for title in component:
+			self.distributions[title]=result[title]
+
+	# filling the parents table with the local sql dumps of the page, categorylinks and page_props tables
+	# catPrefix is the name of the category namespace, e.g. 'Catégorie'
+	def loadDump(self,pageDump,categoryLinksDump,pagePropsDump,catPrefix):
+		if '\tcomplete' in self.parents:
+			return
+		print("Loading the category graph from",categoryLinksDump)
+		# titles of the articles and categories
+		titles={}
+		for line in readInserts(pageDump):
+			for m in regexPage.finditer(line):
+				ns=int(m.group(2))
+				if ns==articleNs:
+					titles[int(m.group(1))]=unescape(m.group(3))
+				elif ns==categoryNs:
+					titles[int(m.group(1))]=catPrefix+':'+unescape(m.group(3))
+		hidden=set()
+		for line in readInserts(pagePropsDump):
+			for m in regexHiddenCat.finditer(line):
+				if int(m.group(1)) in titles:
+					hidden.add(titles[int(m.group(1))])
+		# the parents are sorted as in the API answers
+		links={}
+		for line in readInserts(categoryLinksDump):
+			for m in regexCategoryLink.finditer(line):
+				pageId=int(m.group(1))
+				if pageId not in titles:
+					continue
+				cat=catPrefix+':'+unescape(m.group(2))
+				if cat not in hidden:
+					links.setdefault(titles[pageId],[]).append(cat)
+		with self.lock:
+			for title in titles.values():
+				self.parents[title]=sorted(links.get(title,[]),key=lambda cat: cat.replace(' ','_'))
+			self.parents['\tcomplete']=True
+			self.complete=True
+		print(len(titles),"titles loaded")
+
+# iterating over the INSERT lines of a sql dump (gzip compressed or not)
+def readInserts(fileName):
+	if fileName.endswith('.gz'):
+		dump=gzip.open(fileName,mode='rb')
+	else:
+		dump=open(fileName,mode='rb')
+	with dump:
+		for line in dump:
+			if line.startswith(b'INSERT INTO'):
+				yield line
+
+# sql strings : unescaping, underscores are replaced by spaces as in the API titles
+def unescape(raw):
+	return regexEscape.sub(rb'\1',raw).decode('utf8',errors='replace').replace('_',' ')
@@ -0,0 +1,412 @@
+# -*- coding:utf8 -*-
+
+"""
+Streaming reader for the wikipedia xml dumps (plain or bz2 compressed)
+
+The dump is read as raw bytes and cut into chunks that contain only whole pages.
+The chunks are scanned by a pool of worker processes, which select the talk pages that carry a translation mark.
+The selected pages are yielded in dump order, through a bounded queue that limits the number of chunks in memory.
+
+A multistream dump (pages-articles-multistream.xml.bz2) is made of independent bz2 streams of 100 pages, and its index
+(pages-articles-multistream-index.txt.bz2, lines offset:pageId:title) gives the offset of the stream of each page.
+When the index is next to the dump, the streams are grouped into shards of about chunkSize compressed bytes,
+and each worker reads and decompresses its own shards : the main process only sends the offsets, so that the
+decompression is no longer done by a single thread. The same index gives random access to a page by title (MultistreamDump).
+
+Usage :
+	for (n,title,text) in scanDump(fileName,talkPrefix,markPattern,nbWorkers):
+		...
+
+The pages of an uncompressed dump can also be indexed with indexPages(), so that their texts are read with readText(),
+or the articles can be indexed by the scan itself (scanDump(...,index=table), table being a dict-like object), in the format of indexPages()
+"""
+
+import bz2
+import collections
+import dbm
+import functools
+import html
+import multiprocessing
+import os
+import queue
+import re
+import shelve
+import threading
+
+pageStart=b'<page>'
+pageEnd=b'</page>'
+talkNs=b'1' # namespace number of the talk pages of the articles
+articleNs=b'0'
+
+regexTitle=re.compile(rb'<title>(.*?)</title>',re.S)
+regexNs=re.compile(rb'<ns>(\d+)</ns>')
+regexText=re.compile(rb'<text\b[^>]*?(?:/>|>(.*?)</text>)',re.S)
+regexRedirect=re.compile(rb'<redirect title="([^"]*)"')
+regexRevision=re.compile(rb'<revision>.*?</revision>',re.S)
+regexId=re.compile(rb'<id>(\d+)</id>')
+regexTimestamp=re.compile(rb'<timestamp>([^<]*)</timestamp>')
+regexTextBytes=re.compile(rb'<text\b[^>]*?\bbytes="(\d+)"[^>]*>$')
+textTagSize=256 # maximal length of the text tag that precedes an indexed text
+
+
+# opening the dump file as a binary stream, bz2 files are decompressed on the fly
+def openDump(raw,fileName):
+	if fileName.endswith('.bz2'):
+		return bz2.BZ2File(raw,mode='rb')
+	return raw
+
+# reading the dump by blocks : each yielded chunk ends with a </page> tag, so pages are never split between two chunks
+# the chunks are yielded with their offset in the (uncompressed) dump
+# position, when given, is a dict updated with the size of the file and the number of bytes read so far (compressed bytes for bz2 files)
+# startOffset is the offset where the reading begins, which must be the end of a page (a bz2 file is decompressed up to the offset)
+def readChunks(fileName,chunkSize,position=None,startOffset=0):
+	with open(fileName,mode='rb') as raw, openDump(raw,fileName) as dump:
+		if position is not None:
+			position['size']=os.fstat(raw.fileno()).st_size
+			position['bytes']=0
+		if startOffset:
+			dump.seek(startOffset)
+		rest=b''
+		offset=startOffset
+		while True:
+			block=dump.read(chunkSize)
+			if not block:
+				break
+			data=rest+block
+			end=data.rfind(pageEnd)
+			if end<0:
+				# the current page is bigger than the block : reading goes on
+				rest=data
+				continue
+			end+=len(pageEnd)
+			if position is not None:
+				position['bytes']=raw.tell()
+			yield (offset,data[:end])
+			offset+=end
+			rest=data[end:]
+
+# iterating over the (start,end) positions of the pages of a chunk
+def pageSpans(chunk):
+	end=0
+	while True:
+		start=chunk.find(pageStart,end)
+		if start<0:
+			break
+		end=chunk.find(pageEnd,start)
+		if end<0:
+			end=len(chunk)
+		yield (start,end)
+
+# decoding of a title or a text read in the raw xml
+def decode(raw):
+	return html.unescape(raw.decode('utf8'))
+
+# conversion of a translation mark pattern into a pattern that can be searched in the raw utf8 bytes
+# the bytes regex ignores the case of ascii letters only : the other letters are replaced by an alternation of both cases
+@functools.lru_cache(maxsize=None)
+def bytesPattern(markPattern):
+	pattern=b''
+	for c in markPattern:
+		if ord(c)>127 and c.lower()!=c.upper():
+			pattern+=b'(?:'+c.lower().encode('utf8')+b'|'+c.upper().encode('utf8')+b')'
+		else:
+			pattern+=c.encode('utf8')
+	return re.compile(pattern,re.S|re.I)
+
+# scanning of a chunk (in a worker process) : returns the number of pages of the chunk, the last title,
+# the list of (page number in the chunk, title, text) for the talk pages that contain the translation mark,
+# and, when indexing, the list of the (title, redirect target, revisions) of the articles, as given by chunkPages()
+# the pages are not copied : the namespace, then the mark, are searched inside the chunk, and only the selected pages are decoded
+def scanChunk(chunk,talkPrefix,markPattern,indexing=False):
+	regexMark=bytesPattern(markPattern)
+	found=[]
+	entries=[]
+	nbPages=0
+	start=-1
+	for (start,end) in pageSpans(chunk):
+		nbPages+=1
+		# non talk pages are skipped without reading their text
+		mNs=regexNs.search(chunk,start,end)
+		if mNs and mNs.group(1)!=talkNs:
+			if indexing and mNs.group(1)==articleNs:
+				entries.append(pageEntry(chunk,start,end))
+			continue
+		mText=regexText.search(chunk,start,end)
+		if not mText or mText.start(1)==mText.end(1) or not regexMark.search(chunk,mText.start(1),mText.end(1)):
+			continue
+		title=decode(regexTitle.search(chunk,start,end).group(1))
+		if not re.match(talkPrefix+r'\s*:',title):
+			continue
+		text=decode(mText.group(1))
+		if re.search(markPattern,text,re.S|re.I):
+			found.append((nbPages,title,text))
+	# title of the last page, for progress messages
+	title=""
+	if start>=0:
+		mTitle=regexTitle.search(chunk,start,end)
+		if mTitle:
+			title=decode(mTitle.group(1))
+	return (nbPages,title,found,entries)
+
+# main loop of the scan : yields (page number, title, text) for each selected talk page
+# progress is a dict updated with the number of pages read so far, the last title read, the position in the dump file
+# of the chunks read so far (bytes) with the size of the file (size), and the checkpoints (offset, number of pages before the offset)
+# of the beginning (chunk) and of the end (end) of the current chunk
+# start is a checkpoint where the scan begins (by default, the beginning of the dump)
+# index, when given, is a dict-like object where the articles are recorded as by indexPages() (only for uncompressed dumps, whose texts can be read by offset)
+def scanDump(fileName,talkPrefix,markPattern,nbWorkers=4,chunkSize=4*1024*1024,queueSize=64,progress=None,start=(0,0),index=None):
+	if index is not None and fileName.endswith('.bz2'):
+		raise ValueError("Only the articles of an uncompressed dump can be indexed by offset: "+fileName)
+	if progress is None:
+		progress={}
+	(startOffset,progress['pages'])=start
+	progress['title']=""
+	progress['bytes']=0
+	progress['chunk']=start
+	progress['end']=start
+	position={}
+
+	# sequential scan, without worker processes
+	if nbWorkers<=1:
+		for (offset,end,function,args) in scanTasks(fileName,talkPrefix,markPattern,chunkSize,position,startOffset,index is not None):
+			result=function(*args)
+			progress['size']=position['size']
+			progress['bytes']=position['bytes']
+			for page in readResult(result,progress,offset,end,index):
+				yield page
+		return
+
+	with multiprocessing.Pool(nbWorkers) as pool:
+		# the reader thread submits the chunks to the pool ; the queue is bounded so that the reader
+		# waits when the pages are not consumed fast enough by the next stage
+		results=queue.Queue(queueSize)
+		def feed():
+			try:
+				for (offset,end,function,args) in scanTasks(fileName,talkPrefix,markPattern,chunkSize,position,startOffset,index is not None):
+					results.put((offset,end,position['bytes'],pool.apply_async(function,args)))
+				results.put(None)
+			except Exception as e:
+				results.put(e)
+		reader=threading.Thread(target=feed,daemon=True)
+		reader.start()
+
+		while True:
+			result=results.get()
+			if result is None:
+				break
+			if isinstance(result,Exception):
+				raise result
+			(offset,end,progress['bytes'],asyncResult)=result
+			progress['size']=position['size']
+			for page in readResult(asyncResult.get(),progress,offset,end,index):
+				yield page
+
+# iterating over the scanning tasks of a dump : yields (offset, end, function, arguments), where function(*arguments) returns the result of scanChunk()
+# for a multistream dump, a task is a shard of streams, read and decompressed by the worker, and the offsets are those of the compressed file
+# (the checkpoints of both kinds of scan are not interchangeable, see isMultistream())
+def scanTasks(fileName,talkPrefix,markPattern,chunkSize,position,startOffset,indexing=False):
+	if isMultistream(fileName):
+		position['size']=os.path.getsize(fileName)
+		position['bytes']=0
+		for (start,end) in streamShards(multistreamOffsets(fileName),position['size'],chunkSize,startOffset):
+			position['bytes']=end
+			yield (start,end,scanStreams,(fileName,start,end,talkPrefix,markPattern))
+	else:
+		for (offset,chunk) in readChunks(fileName,chunkSize,position,startOffset):
+			yield (offset,offset+len(chunk),scanChunk,(chunk,talkPrefix,markPattern,indexing))
+
+# updating the progress (and the index) with the result of the chunk between offset and end, and returning its selected pages with their page number in the whole dump
+def readResult(result,progress,offset,end,index=None):
+	(nbPages,lastTitle,found,entries)=result
+	if index is not None:
+		for (title,redirect,revisions) in entries:
+			index[title]=(redirect,[(revid,timestamp,offset+start if start>=0 else -1,length) for (revid,timestamp,start,length) in revisions])
+	n=progress['pages']
+	if (n+nbPages)//10000 > n//10000:
+		print (n+nbPages,lastTitle)
+	progress['pages']=n+nbPages
+	progress['title']=lastTitle
+	progress['chunk']=(offset,n)
+	progress['end']=(end,n+nbPages)
+	return [(n+k,title,text) for (k,title,text) in found]
+
+# iterating over the pages of a dump in order to index them : yields (title, redirect target, revisions)
+# where revisions is the list of (revid, timestamp, offset of the text in the dump, length of the text)
+# the offset is -1 when the text is not in the dump (stub dumps)
+def indexPages(fileName,chunkSize=4*1024*1024):
+	for (offset,chunk) in readChunks(fileName,chunkSize):
+		for (title,redirect,revisions) in chunkPages(chunk):
+			yield (title,redirect,[(revid,timestamp,offset+start if start>=0 else -1,length) for (revid,timestamp,start,length) in revisions])
+
+# iterating over the pages of a chunk : yields (title, redirect target, revisions), the offsets of the texts being relative to the chunk
+def chunkPages(chunk):
+	for (start,end) in pageSpans(chunk):
+		yield pageEntry(chunk,start,end)
+
+# reading the page between start and end : returns (title, redirect target, revisions)
+def pageEntry(chunk,start,end):
+	title=decode(regexTitle.search(chunk,start,end).group(1))
+	revisions=[]
+	firstRevision=end
+	for mRevision in regexRevision.finditer(chunk,start,end):
+		(revStart,revEnd)=mRevision.span()
+		firstRevision=min(firstRevision,revStart)
+		mId=regexId.search(chunk,revStart,revEnd)
+		mTimestamp=regexTimestamp.search(chunk,revStart,revEnd)
+		mText=regexText.search(chunk,revStart,revEnd)
+		if mText and mText.start(1)>=0:
+			revisions.append((int(mId.group(1)),mTimestamp.group(1).decode('ascii'),mText.start(1),mText.end(1)-mText.start(1)))
+		else:
+			revisions.append((int(mId.group(1)),mTimestamp.group(1).decode('ascii'),-1,0))
+	mRedirect=regexRedirect.search(chunk,start,firstRevision)
+	redirect=decode(mRedirect.group(1)) if mRedirect else None
+	return (title,redirect,revisions)
+
+# reading a text indexed by indexPages() in an uncompressed dump
+def readText(dump,offset,length):
+	dump.seek(offset)
+	return decode(dump.read(length))
+
+# size in bytes of a text indexed by indexPages(), read in the text tag that precedes it, without reading the text
+def readTextSize(dump,offset,length):
+	start=max(offset-textTagSize,0)
+	dump.seek(start)
+	return textSize(dump.read(offset-start),length)
+
+# size given by the bytes attribute of the text tag at the end of tag, or the length of the escaped text in the dump when it is missing
+def textSize(tag,length):
+	mBytes=regexTextBytes.search(tag)
+	if mBytes:
+		return int(mBytes.group(1))
+	return length
+
+#**************************************************************** MULTISTREAM DUMPS
+
+# the index of pages-articles-multistream.xml.bz2 is pages-articles-multistream-index.txt.bz2
+def multistreamIndexName(fileName):
+	if not fileName.endswith('.xml.bz2'):
+		return None
+	return fileName[:-len('.xml.bz2')]+'-index.txt.bz2'
+
+# a dump is read by streams when it is a bz2 dump with its multistream index
+def isMultistream(fileName):
+	indexName=multistreamIndexName(fileName)
+	return indexName is not None and os.path.exists(indexName)
+
+# iterating over the lines of a multistream index : yields (offset of the stream, title)
+def readMultistreamIndex(indexName):
+	with bz2.open(indexName,mode='rt',encoding='utf8') as index:
+		for line in index:
+			(offset,pageId,title)=line.rstrip('\n').split(':',2)
+			yield (int(offset),title)
+
+# opening the title index of a multistream dump (a shelve title -> (start, end) of its stream, with the sorted offsets
+# of the streams in '\tstreams'), which is built from the multistream index if it does not exist or if its building has been interrupted
+def openMultistreamIndex(fileName):
+	indexName=fileName+'.index'
+	try:
+		index=shelve.open(indexName,flag='r')
+		if '\tcomplete' in index:
+			return index
+		index.close()
+	except dbm.error:
+		pass
+	print("Indexing",fileName)
+	with shelve.open(indexName,flag='n') as index:
+		offsets=[]
+		titles=[]
+		# the titles of a stream are recorded when the next stream begins : the last stream ends with the file
+		for (offset,title) in readMultistreamIndex(multistreamIndexName(fileName)):
+			if not offsets or offset!=offsets[-1]:
+				for t in titles:
+					index[t]=(offsets[-1],offset)
+				offsets.append(offset)
+				titles=[]
+			titles.append(title)
+		for t in titles:
+			index[t]=(offsets[-1],os.path.getsize(fileName))
+		index['\tstreams']=offsets
+		index['\tcomplete']=True
+	return shelve.open(indexName,flag='r')
+
+# sorted offsets of the streams of a multistream dump (the first stream, with the siteinfo, and the last one are not in the index)
+def multistreamOffsets(fileName):
+	index=openMultistreamIndex(fileName)
+	try:
+		return index['\tstreams']
+	finally:
+		index.close()
+
+# grouping the consecutive streams that begin at startOffset or after into shards of about chunkSize compressed bytes :
+# yields the (start,end) offsets of the shards, the last shard ending with the file
+def streamShards(offsets,fileSize,chunkSize,startOffset=0):
+	start=None
+	for k in range(len(offsets)):
+		if offsets[k]<startOffset:
+			continue
+		if start is None:
+			start=offsets[k]
+		end=offsets[k+1] if k+1<len(offsets) else fileSize
+		if end-start>=chunkSize or k+1==len(offsets):
+			yield (start,end)
+			start=None
+
+# reading and decompressing the streams between start and end
+def readStreams(raw,start,end):
+	raw.seek(start)
+	return bz2.decompress(raw.read(end-start))
+
+# scanning of a shard of streams (in a worker process), which opens the dump itself
+def scanStreams(fileName,start,end,talkPrefix,markPattern):
+	with open(fileName,mode='rb') as raw:
+		chunk=readStreams(raw,start,end)
+	return scanChunk(chunk,talkPrefix,markPattern)
+
+# random access to the pages of a multistream dump by title : the stream of the title is decompressed, and the last
+# decompressed streams are kept (the pages of a stream are neighbours in the dump, and often read together)
+# not thread safe : the callers share the object under a lock
+class MultistreamDump:
+	def __init__(self,fileName,cacheSize=8):
+		self.raw=open(fileName,mode='rb')
+		self.index=openMultistreamIndex(fileName)
+		self.cacheSize=cacheSize
+		# start of the stream -> (chunk, dict title -> (redirect target, revisions))
+		self.streams=collections.OrderedDict()
+
+	# returns (redirect target, list of (revid, timestamp, text)) or None when the title is not in the dump
+	# the text is None for the revisions without text
+	def get(self,title):
+		span=self.index.get(title)
+		if span is None:
+			return None
+		(chunk,pages)=self.stream(*span)
+		if title not in pages:
+			return None
+		(redirect,revisions)=pages[title]
+		return (redirect,[(revid,timestamp,decode(chunk[start:start+length]) if start>=0 else None) for (revid,timestamp,start,length) in revisions])
+
+	# same as get(), with the sizes of the texts (see textSize()) instead of the texts
+	def getSizes(self,title):
+		span=self.index.get(title)
+		if span is None:
+			return None
+		(chunk,pages)=self.stream(*span)
+		if title not in pages:
+			return None
+		(redirect,revisions)=pages[title]
+		return (redirect,[(revid,timestamp,textSize(chunk[max(start-textTagSize,0):start],length) if start>=0 else None) for (revid,timestamp,start,length) in revisions])
+
+	def stream(self,start,end):
+		if start in self.streams:
+			self.streams.move_to_end(start)
+			return self.streams[start]
+		chunk=readStreams(self.raw,start,end)
+		pages={title:(redirect,revisions) for (title,redirect,revisions) in chunkPages(chunk)}
+		self.streams[start]=(chunk,pages)
+		if len(self.streams)>self.cacheSize:
+			self.streams.popitem(last=False)
+		return (chunk,pages)
+
+	def close(self):
+		self.raw.close()
+		self.index.close()
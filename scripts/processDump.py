@@ -4,20 +4,32 @@
 Browse the dump file and search translated articles, according to explicit translation mark
 When original version length in close to translated version's length, both content are saved, in raw text
 
-Usage : python3 processDump.py [LANG]
+Usage : python3 processDump.py [LANG...]
 Example : python3 processDump.py es
+With several languages (e.g. python3 processDump.py fr de it), the dumps of the languages are processed in parallel, by one process
+per language : the processes share the revision cache, so that a source article, its cleaned text or its categories are fetched once
+for all the languages
 
 """
 
-import mwclient
-from wiki_dump_reader import iterate
+from dumpReader import scanDump,isMultistream
+from revisionSource import ApiSource,DumpSource,RevisionBatcher
+from revisionCache import RevisionCache
+from wikitextCleaner import cleanText,cleanerVersion
+from categoryGraph import CategoryGraph
+from stateStore import StateStore
+from runMetrics import RunMetrics
 import pywikibot as pw
 import re
 import sys
-import shelve
 import os
 import time
 import urllib.parse
+import hashlib
+import threading
+import collections
+import concurrent.futures
+import subprocess
 
 # INSTALL NOTE
 # pywikibot : 
@@ -30,19 +42,62 @@ import urllib.parse
 targetLang='en'
 translationRatio=1.05 # average increasement of word length due to translation
 revisionStep=5
+firstRevisionSearch='bisection' # 'bisection' : binary search in the list of the revision ids, 'linear' : stepping of revisionStep revisions
 #nbOfDaysBetweenSourceIdAndTargetId=60
 diffThreshold=0 # 0 for no threshold
+revisionSearchThreshold=0.15 # the first revision with the translation mark is searched when abs(wordLengthDiff) is over the threshold
+# length prefilter : the sizes in bytes of the texts are queried first, and the source articles of the pairs that clearly cannot match,
+# according to their numbers of words estimated with the bytes per word ratio of each language (measured on the texts already processed),
+# are not downloaded
+lengthPrefilter=True
+prefilterMargin=0.1 # uncertainty of the estimated wordLengthDiff
+minModelTexts=50 # min number of texts of a language processed before its bytes per word ratio is used
 recordAlignedFile=True
 nBest=10
+nbScanWorkers=4 # number of processes that scan the dump (1 for a sequential scan)
+scanChunkSize=4*1024*1024 # size in bytes of the dump chunks sent to the scanning processes (compressed bytes of the shards of streams for a multistream dump)
+scanQueueSize=64 # max number of chunks waiting for the next stage
+resumeFromCheckpoint=True # a run begins at the checkpoint recorded for the dump by the previous run, instead of the beginning of the dump
+# two phases : the talk pages with a translation mark are collected by the scan, which indexes the articles of the dump (in DUMP.articles.sqlite,
+# with its own checkpoint), then the target texts and ids are read in the scanned dump instead of the revision source (for uncompressed and multistream dumps)
+targetFromDump=True
+nbFetchThreads=16 # number of threads that download the target pages, the categories and the source articles
+fetchWindow=32 # max number of pages fetched in advance of the processing
+maxRequestsPerHost=4 # max number of simultaneous API requests to a given wikipedia
+minRequestInterval=0.05 # min interval (in seconds) between two API requests to a given wikipedia
+apiBatchSize=50 # max number of revision ids or titles in a batched API query (0 for one query per page)
+apiBatchDelay=2 # max delay (in seconds) before a batch that is not full is sent
+sharedFetchTimeout=120 # max time (in seconds) waited for a revision that is being fetched by another process sharing the cache
+# top categories of the articles : 'walk' for the frequency based walk of findSuperCats, one walk for each article, each top category
+# found counting the whole article, or 'distribution' for the top categories distribution of the parents, memoized for each category,
+# each top category counting its share of the article ; the stats of the distribution are recorded apart (statsPerCatDistribution)
+categoryMode='walk'
 
 
-if len(sys.argv)==2 and len(sys.argv[1])==2:
-	targetLang=sys.argv[1]
+# target languages given as arguments (without duplicates), checked with the constants below
+targetLangs=list(dict.fromkeys(sys.argv[1:]))
+if len(targetLangs)==1:
+	targetLang=targetLangs[0]
 	
-#~ wikidumpName='wiki-20201201-pages-articles-multistream.xml'
+# a multistream dump is scanned in parallel by streams when its index (wiki-20201201-pages-articles-multistream-index.txt.bz2) is next to it
+#~ wikidumpName='wiki-20201201-pages-articles-multistream.xml.bz2'
 wikidumpName='wiki-20201220-pages-meta-current.xml'
 wikidumpName='wiki-20201201-pages-meta-current.xml'
 outputPath="/home/kraifo/Documents/WikipediaParaCorpus/data"
+# local dumps, read before the API (offline first) : for each language, the files localDumpPath/LANG+name that exist
+# pages-articles gives the current texts, stub or history dumps give the revisions (they must be uncompressed,
+# except the multistream dumps, read by stream through their index)
+localDumpPath="/home/kraifo/Documents/WikipediaParaCorpus/dumps"
+localDumpNames=['wiki-20201201-pages-articles.xml','wiki-20201201-pages-articles-multistream.xml.bz2','wiki-20201201-stub-meta-history.xml']
+# local sql dumps of the category graph (page, categorylinks and page_props tables), loaded once in the parentCats table of the state file
+categoryDumpNames=['wiki-20201201-page.sql.gz','wiki-20201201-categorylinks.sql.gz','wiki-20201201-page_props.sql.gz']
+# cache of the fetched revisions, cleaned texts and categories, shared by all the languages (and by the processes of a shared run)
+cachePath=outputPath+"/revisionCache.sqlite"
+maxCacheSize=20*1024**3 # in bytes (compressed)
+# metrics of the run (time of each stage, counters, speed and ETA), written every metricsInterval seconds,
+# in the Prometheus text format for a .prom file, in JSON lines otherwise
+metricsFile=outputPath+"/metrics."+targetLang+".prom"
+metricsInterval=10
 wordCountRef={ 
 	'no':1702,
 	'ee':2252,
@@ -108,10 +163,6 @@ wordCountRef={
 
 
 
-log=open(outputPath+"/processDump."+targetLang+".log",mode="a",encoding="utf8")
-
-mwSites={}
-
 # constants
 
 translationMarks={
@@ -133,6 +184,15 @@ talkNameSpace={
 	'vi':'Thảo luận'
 }
 
+categoryNameSpace={
+	'fr':'Catégorie',
+	'en':'Category',
+	'de':'Kategorie',
+	'it':'Categoria',
+	'es':'Categoría',
+	'vi':'Thể loại'
+}
+
 supraCats={
 	'fr':[
 		'Catégorie:Article',
@@ -360,6 +420,35 @@ superCats={
 	}
 }
 
+# a target language needs its translation mark and the name of its talk namespace
+unknownLangs=[lang for lang in targetLangs if lang not in translationMarks or lang not in talkNameSpace]
+if unknownLangs:
+	print("Unknown language:",", ".join(unknownLangs),"- known languages:",", ".join(sorted(set(translationMarks.keys()) & set(talkNameSpace.keys()))))
+	sys.exit(1)
+
+# shared run of several languages : one process per language, the API requests to a given wikipedia being shared between the processes
+if len(targetLangs)>1:
+	processes=[]
+	for lang in targetLangs:
+		env=dict(os.environ,PROCESSDUMP_SHARED_RUN=str(len(targetLangs)))
+		processes.append(subprocess.Popen([sys.executable,os.path.abspath(__file__),lang],env=env))
+	sys.exit(max(process.wait() for process in processes))
+if 'PROCESSDUMP_SHARED_RUN' in os.environ:
+	nbSharedProcesses=int(os.environ['PROCESSDUMP_SHARED_RUN'])
+	maxRequestsPerHost=max(1,maxRequestsPerHost//nbSharedProcesses)
+	minRequestInterval*=nbSharedProcesses
+
+log=open(outputPath+"/processDump."+targetLang+".log",mode="a",encoding="utf8")
+
+revisionSources={}
+# the revision sources are opened by the fetching threads
+sourcesLock=threading.Lock()
+# the batchers of the API queries, for each language
+batchers={}
+
+cache=RevisionCache(cachePath,maxCacheSize)
+metrics=RunMetrics(metricsFile,metricsInterval,{'lang':targetLang})
+
 # building topCats lists extracted from superCats tree
 topCats={}
 
@@ -375,33 +464,6 @@ parentCats={}
 
 
 
-"""
-wiki_dump_reader.Cleaner() is not used, because it removes hyperlink texts
-
-cleaning rules
-
-[[...|texte du lien à conserver]]
-{{lien web| à supprimer}}
-<ref>référence à supprimer</ref>
-''à mettre entre guillemets''
-{{balises à supprimer}}
-{| tableaux à supprimer |}
-{{date-|20 avril 1961}}
-
-"""
-
-regexCat=re.compile(r'\[\[\s*[KC]at\w+\s*:(.*?)\]\]')
-regexLink=re.compile(r'\[\[(?:[^\[\]]*\|)?([^\[\]]+)\]\]',re.S)
-regexBaliseAConserver=re.compile(r'\{\{(?:[^{}\n]*\|)([^|{}\n]*)\}\}',re.S)
-regexBalise=re.compile(r'\{\{[^{}]*\}\}',re.S)
-regexComment=re.compile(r'<!--[^>]*-->',re.S)
-regexRef=re.compile(r'<ref\b.*?<\/ref>',re.S)
-regexMarkup=re.compile(r'<[^>]*>',re.S)
-regexTableau=re.compile(r'\{\|.*?\|\}',re.S)
-regexEmptyLines=re.compile(r'\n\s*',re.S)
-regexQuotes=re.compile(r"''",re.S)
-
-
 def printLog(*msg):
 	log.write(" ".join(msg)+"\n")
 	print("\nlog > "+" ".join(msg))
@@ -474,42 +536,61 @@ def extractTranslationMark (text,regexTrans):
 
 	return result
 
-# text cleaning
+# text cleaning : the cleaned texts are cached, by sha1 of the raw text (and version of the cleaner)
 def clean(text) :
-	if text:
-		text=regexCat.sub('',text)
-		text=regexLink.sub('\g<1>',text)
-		# suppression des balises en plusieurs temps, car elles sont possiblement imbriquées jusqu'à 3 niveaux
-		text=regexBaliseAConserver.sub('\g<1>',text)
-		text=regexComment.sub('',text)
-		text=regexBalise.sub('',text)
-		text=regexBalise.sub('',text)
-		text=regexBalise.sub('',text)
-		text=regexBalise.sub('',text)
-		text=regexLink.sub('\g<1>',text)
-		
-		text=regexTableau.sub('',text)
-		text=regexRef.sub('',text)
-		text=regexEmptyLines.sub("\n",text)
-		text=regexQuotes.sub('"',text)
-		
-		return text
-	else:
+	if not text:
 		return ""
+	key=('clean',cleanerVersion,hashlib.sha1(text.encode('utf8')).hexdigest())
+	cleanedText=cache.get(key)
+	if cleanedText is None:
+		with metrics.timer('clean'):
+			cleanedText=cleanText(text)
+		cache.put(key,cleanedText)
+	return cleanedText
+
+# string representation of a timestamp (struct_time or string) for the cache keys
+def timestampKey(timestamp):
+	if isinstance(timestamp,time.struct_time):
+		return time.strftime('%Y-%m-%dT%H:%M:%SZ',timestamp)
+	return str(timestamp)
+
+# returns the value of key in the cache, or the result of fetch(), recorded in the cache when it is valid
+# the key is claimed during the fetch : when it is already claimed by another process, its value is waited for in the cache
+def cachedFetch(key,fetch,valid):
+	value=cache.get(key)
+	if value is not None:
+		return value
+	if not cache.claim(key):
+		value=cache.wait(key,sharedFetchTimeout)
+		if value is not None:
+			return value
+		cache.claim(key)
+	try:
+		value=fetch()
+		if valid(value):
+			cache.put(key,value)
+	finally:
+		cache.release(key)
+	return value
 
-# function that uses mwclient to retrieve a given revision
-def getArticleByTitleAndId(site,title,articleId):
+# function that retrieves a given revision, from the cache if possible
+def getArticleByTitleAndId(source,title,articleId):
+	key=('id',source.lang,title,articleId)
+	return cachedFetch(key,lambda: fetchArticleByTitleAndId(source,title,articleId),lambda result: result[0])
+
+def fetchArticleByTitleAndId(source,title,articleId):
 	try :
-		page=mwclient.page.Page(site,urllib.parse.unquote(title)).resolve_redirect()
+		page=source.page(urllib.parse.unquote(title))
 	except:
 		printLog("Error : impossible to download article:",urllib.parse.unquote(title))
+		metrics.count('downloadFailures')
 		return ("",0)
 	
 	# looking for revision that corresponds to recherche des révisions correspondant à articleId
 	revs=page.revisions(startid=articleId,endid=articleId,prop='content|timestamp')
 				
 	try :
-		rev=revs.next()
+		rev=next(revs)
 		if '*' in rev.keys(): 
 			return (str(rev['*']),rev['timestamp'])
 		else:
@@ -518,18 +599,24 @@ def getArticleByTitleAndId(site,title,articleId):
 		# when articleId is null return here
 		return (str(page.text()),0)
 
-def getArticleByTitleAndTimestamp(site,title,timestamp):
+# function that retrieves the revision at a given timestamp, from the cache if possible
+def getArticleByTitleAndTimestamp(source,title,timestamp):
+	key=('timestamp',source.lang,title,timestampKey(timestamp))
+	return cachedFetch(key,lambda: fetchArticleByTitleAndTimestamp(source,title,timestamp),lambda text: text)
+
+def fetchArticleByTitleAndTimestamp(source,title,timestamp):
 	try :
-		page=mwclient.page.Page(site,urllib.parse.unquote(title)).resolve_redirect()
+		page=source.page(urllib.parse.unquote(title))
 	except:
 		printLog("Error : impossible to download article:",urllib.parse.unquote(title))
+		metrics.count('downloadFailures')
 		return ""
 	
 	# looking for revision that corresponds to recherche des révisions correspondant à articleId
 	revs=page.revisions(start=timestamp,dir='older',prop='content')
 				
 	try :
-		rev=revs.next()
+		rev=next(revs)
 		if '*' in rev.keys(): 
 			return str(rev['*'])
 		else:
@@ -538,19 +625,36 @@ def getArticleByTitleAndTimestamp(site,title,timestamp):
 		# when timestamp is null return here
 		return page.text()
 
-# function that uses mwclient to retrieve the current version
-def getArticleByTitle(site,title):
+# function that retrieves the current version
+def getArticleByTitle(source,title):
 	try :
-		page=mwclient.page.Page(site,urllib.parse.unquote(title)).resolve_redirect()
+		page=source.page(urllib.parse.unquote(title))
 		return page.text()
 	except:
 		printLog("Error : impossible to download article:",title)
+		metrics.count('downloadFailures')
 		return ""
 
 # search the revision history in order to find the first version that corresponds to the translation
+# the result (timestamp and id of the first revision) is cached
 def getFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,translationMark,sourceTitle,timestamp):
+	key=('first',targetLang,targetTitle,sourceTitle,timestampKey(timestamp))
+	cached=cache.get(key)
+	if cached is not None:
+		(firstTimestamp,firstId)=cached
+		if firstId and not targetTitle in firstRevisionIdHash:
+			firstRevisionIdHash[targetTitle]=firstId
+		return firstTimestamp
+	firstTimestamp=searchFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,translationMark,sourceTitle,timestamp)
+	if firstTimestamp:
+		cache.put(key,(firstTimestamp,firstRevisionIdHash.get(targetTitle,"")))
+	return firstTimestamp
+
+def searchFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,translationMark,sourceTitle,timestamp):
+	if firstRevisionSearch=='bisection' and not targetTitle in firstRevisionIdHash:
+		return bisectFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,translationMark,sourceTitle,timestamp)
 	articleId=""
-	if targetTitle in firstRevisionIdHash.keys():
+	if targetTitle in firstRevisionIdHash:
 		articleId=firstRevisionIdHash[targetTitle]
 		print("first revision id is",articleId)
 		revs=page.revisions(prop='content|ids|timestamp',startid=articleId,endid=articleId)
@@ -568,7 +672,7 @@ def getFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,t
 				currentId=str(rev['revid'])
 				currentTimestamp=rev['timestamp']
 				# when the translation markup is found break
-				if  re.search(translationMark+'[^}]*'+sourceTitle+r'[^}]*\}\}',rev['*']):
+				if hasTranslationMarkup(rev['*'],translationMark,sourceTitle):
 					break
 			# stepping forward of 20 revisions
 			count=0
@@ -578,34 +682,60 @@ def getFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,t
 					currentId=str(rev['revid'])
 					currentTimestamp=rev['timestamp']
 				try: 
-					rev=revs.next()
+					rev=next(revs)
 				except:
 					break
 	except:
 		printLog("Error while retrieving first revision for",targetTitle)
+		metrics.count('revisionSearchFailures')
 		return 0
 	if currentId and not articleId :
 		firstRevisionIdHash[targetTitle]=currentId
 	return currentTimestamp
 
+# binary search of the first revision that contains the translation markup : the ids and timestamps of the revisions are listed,
+# and the content is downloaded only for the tested revisions (the markup is supposed to be kept once it has been added)
+# when no revision contains the markup, the last revision is returned, as in the linear search
+def bisectFirstRevisionWithTranslationMarkup(firstRevisionIdHash,targetTitle,page,translationMark,sourceTitle,timestamp):
+	try :
+		if timestamp :
+			revs=page.revisions(prop='ids|timestamp',start=timestamp,dir='newer')
+		else:
+			revs=page.revisions(prop='ids|timestamp',dir='newer')
+		history=[(str(rev['revid']),rev['timestamp']) for rev in revs]
+		if not history:
+			return ""
+		low=0
+		high=len(history)-1
+		while low<high:
+			middle=(low+high)//2
+			revs=page.revisions(prop='content|ids|timestamp',startid=history[middle][0],endid=history[middle][0])
+			rev=next(revs,None)
+			if rev and '*' in rev.keys() and hasTranslationMarkup(rev['*'],translationMark,sourceTitle):
+				high=middle
+			else:
+				low=middle+1
+	except:
+		printLog("Error while retrieving first revision for",targetTitle)
+		metrics.count('revisionSearchFailures')
+		return 0
+	(currentId,currentTimestamp)=history[low]
+	firstRevisionIdHash[targetTitle]=currentId
+	return currentTimestamp
+
+def hasTranslationMarkup(text,translationMark,sourceTitle):
+	return re.search(translationMark+'[^}]*'+sourceTitle+r'[^}]*\}\}',text)
+
 # basic word counting
 def countWords(text):
-	words=re.findall(r'\w+',text,re.U)
+	with metrics.timer('wordCount'):
+		words=re.findall(r'\w+',text,re.U)
 	return len(words)
 
 # category management
 
-def findParentCat(parentCats,pwSite,myPage):
-	if not myPage in parentCats.keys():
-		parentCats[myPage]=[
-			cat.title()
-			for cat in pw.Page(pwSite, myPage).categories()
-			if 'hidden' not in cat.categoryinfo
-		]
-		
-	return parentCats[myPage]
-
-def findSuperCats(topCats,supraCats,parentCats,pwSite,myPage):
+# the parent categories are read in the category graph, which fetches the categories of a whole level in batched queries
+def findSuperCats(topCats,supraCats,graph,myPage):
 	# on crée des listes de catégories enregistrant la fréquence associée à chaque cat.
 	currentList={}
 	# initialement on n'a qu'une page, avec une fréquence 1
@@ -618,9 +748,10 @@ def findSuperCats(topCats,supraCats,parentCats,pwSite,myPage):
 			break
 		loop=False
 		newList={}
+		graph.prefetch(list(currentList.keys()))
 		# pour chaque page de la liste courante, on cherche ses parents
 		for page in currentList.keys():
-			parents=findParentCat(parentCats,pwSite,page)
+			parents=graph.getParents(page)
 			# si la cat. a des parents en dehors des supraCats
 			if parents and parents[0] not in supraCats:
 				# dans la nouvelle liste on substitue chaque page par ses parents, qui héritent de sa fréquence
@@ -657,6 +788,374 @@ def findSuperCats(topCats,supraCats,parentCats,pwSite,myPage):
 	
 	return sortedCats
 
+# opening the revision source of a language : the local dumps when they exist, else the API
+def openRevisionSource(lang):
+	fileNames=[os.path.join(localDumpPath,lang+name) for name in localDumpNames if os.path.exists(os.path.join(localDumpPath,lang+name))]
+	if fileNames:
+		print("Using local dumps for",lang,":",", ".join(fileNames))
+		return DumpSource(lang,fileNames)
+	return ApiSource(lang,maxRequestsPerHost,minRequestInterval)
+
+# returns the revision source of a language, opened at first use (None if it cannot be opened)
+def getRevisionSource(lang):
+	with sourcesLock:
+		if not lang in revisionSources.keys():
+			print("Opening revision source for",lang)
+			try:
+				revisionSources[lang]= openRevisionSource(lang)
+			except Exception as e:
+				printLog("impossible to load wiki for language",lang,":",e)
+		return revisionSources.get(lang)
+
+# returns the batcher of the API queries of a language, or None when its revision source is not the API
+def getBatcher(lang):
+	source=getRevisionSource(lang)
+	if apiBatchSize<=0 or not isinstance(source,ApiSource):
+		return None
+	with sourcesLock:
+		if not lang in batchers:
+			batchers[lang]=RevisionBatcher(source,apiBatchSize,maxRequestsPerHost,apiBatchDelay)
+		return batchers[lang]
+
+# runs function(future) in the executor once future is done : returns the future of the function
+# (the threads of the pool do not wait for the batched queries)
+def chain(executor,future,function):
+	chained=concurrent.futures.Future()
+	def copy(inner):
+		if inner.exception() is not None:
+			chained.set_exception(inner.exception())
+		else:
+			chained.set_result(inner.result())
+	future.add_done_callback(lambda done: executor.submit(function,done).add_done_callback(copy))
+	return chained
+
+# the batched requests of a page, recorded in batched as (batcher, future), are sent before waiting for its results
+def flushBatches(batched):
+	for (batcher,future) in batched:
+		batcher.flush([future])
+
+# submitting the download of the target page : returns the future of the result of fetchTarget()
+# the current revision is fetched by a batched query when the target articles are read in the API
+def submitTarget(executor,batched,targetTitle,triples,targetSource):
+	batcher=getBatcher(targetLang) if targetSource is revisionSources[targetLang] else None
+	if batcher is None:
+		return executor.submit(fetchTarget,targetTitle,triples,targetSource)
+	future=batcher.fetch(urllib.parse.unquote(targetTitle))
+	batched.append((batcher,future))
+	return chain(executor,future,lambda done: fetchTarget(targetTitle,triples,targetSource,done))
+
+# submitting the download of a source article : returns the future of the result of fetchSource()
+# the revisions that are not in the cache are claimed, and fetched by batched queries when the source language is read in the API
+# (the revisions claimed by another process sharing the cache are waited for)
+# the batches are sent at the latest apiBatchDelay seconds after their first request, and their results are recorded in the cache
+# by the threads of the batcher, so that a claimed revision never waits for the processing of the pages of its process
+def submitSource(executor,batched,sourceLang,sourceTitle,sourceId):
+	batcher=getBatcher(sourceLang)
+	if batcher is None:
+		return executor.submit(fetchSource,sourceLang,sourceTitle,sourceId)
+	key=('id',sourceLang,sourceTitle,sourceId)
+	cached=cache.get(key)
+	if cached is not None:
+		future=concurrent.futures.Future()
+		future.set_result(cached)
+		return future
+	if not cache.claim(key):
+		return executor.submit(waitSource,key,sourceLang,sourceTitle,sourceId)
+	future=batcher.fetch(urllib.parse.unquote(sourceTitle),sourceId)
+	batched.append((batcher,future))
+	result=concurrent.futures.Future()
+	def record(done):
+		try:
+			result.set_result(readBatchedSource(key,done))
+		except Exception as e:
+			result.set_exception(e)
+	future.add_done_callback(record)
+	return result
+
+# result of a batched source query : (text, timestamp) as given by getArticleByTitleAndId() (the timestamp is 0 when the revision
+# sourceId has not been found and the current revision is returned)
+def readBatchedSource(key,done):
+	try:
+		(name,revid,timestamp,text)=done.result()
+	except:
+		printLog("Error : impossible to download article:",urllib.parse.unquote(key[2]))
+		metrics.count('downloadFailures')
+		cache.release(key)
+		return ("",0)
+	if timestamp is None:
+		result=(text,0)
+	else:
+		result=(text,time.strptime(timestamp,'%Y-%m-%dT%H:%M:%SZ'))
+	if result[0]:
+		cache.put(key,result)
+	else:
+		cache.release(key)
+	return result
+
+# waiting for a source article claimed by another process sharing the cache : it is fetched by fetchSource()
+# when the claim is released without result
+def waitSource(key,sourceLang,sourceTitle,sourceId):
+	with metrics.timer('waitSource'):
+		result=cache.wait(key,sharedFetchTimeout)
+	if result is not None:
+		return result
+	return fetchSource(sourceLang,sourceTitle,sourceId)
+
+# fetching functions, run by the threads of the pool
+
+# downloading the target page : returns (page, cleaned text, current id, cleaned texts of the revIds indicated in the triples,
+# size of the current text in bytes) or None when the page cannot be downloaded
+# source is the revision source of the target language, or the scanned dump, which has only the current revisions ;
+# current, when given, is the future of the batched query of the current revision
+# page is the page of the revision source, or None when it has not been needed (it is then opened for the first revision search)
+def fetchTarget(targetTitle,triples,source,current=None):
+	try:
+		with metrics.timer('fetchTarget'):
+			if current is None:
+				page=source.page(urllib.parse.unquote(targetTitle))
+				text=page.text()
+			else:
+				page=None
+				(name,revid,timestamp,text)=current.result()
+		cleanedTargetText=clean(text)
+	except:
+		print("Error while downloading page",targetTitle)
+		metrics.count('targetFailures')
+		return None
+
+	# Searching current article ID
+	targetSize=len(text.encode('utf8'))
+	if page is None:
+		targetId=str(revid) if revid else ""
+	else:
+		with metrics.timer('fetchTarget'):
+			revs=page.revisions(prop="ids",dir='older')
+			try:
+				rev=next(revs)
+				targetId=str(rev['revid'])
+			except:
+				targetId=""
+	if source is not revisionSources[targetLang]:
+		page=None
+
+	# dans le cas où revId est indiqué (allemand) on charge la bonne révision
+	revTexts={}
+	for triple in triples:
+		if len(triple)==4 and triple[3] and triple[3] not in revTexts:
+			try:
+				with metrics.timer('fetchTarget'):
+					if page is None:
+						page=revisionSources[targetLang].page(urllib.parse.unquote(targetTitle))
+					revs=page.revisions(prop='content|ids',startid=triple[3],dir='newer')
+					rev=next(revs)
+				revTexts[triple[3]]=clean(rev['*'])
+			except:
+				revTexts[triple[3]]=None
+	return (page,cleanedTargetText,targetId,revTexts,targetSize)
+
+# returns a dict category -> weight of the article in the category (1 except for the distribution)
+def fetchCategories(graph,targetTitle):
+	with metrics.timer('categories'):
+		if targetLang in topCats.keys():
+			if categoryMode=='distribution':
+				return graph.topDistribution(targetTitle,set(topCats[targetLang]),set(supraCats[targetLang]))
+			return dict.fromkeys(findSuperCats(topCats[targetLang],supraCats[targetLang],graph,targetTitle),1)
+		return dict.fromkeys(graph.getParents(targetTitle),1)
+
+# opening the category graph, filled with the local sql dumps when they exist
+def openCategoryGraph(parentCats,pwSite,lang):
+	graph=CategoryGraph(parentCats,pwSite,cache)
+	fileNames=[os.path.join(localDumpPath,lang+name) for name in categoryDumpNames]
+	if lang in categoryNameSpace.keys() and all(os.path.exists(fileName) for fileName in fileNames):
+		graph.loadDump(fileNames[0],fileNames[1],fileNames[2],categoryNameSpace[lang])
+	return graph
+
+# downloading a source article : returns (text, timestamp), or None when the source language cannot be opened
+def fetchSource(sourceLang,sourceTitle,sourceId):
+	source=getRevisionSource(sourceLang)
+	if source is None:
+		metrics.count('sourceFailures')
+		return None
+	with metrics.timer('fetchSource'):
+		return getArticleByTitleAndId(source,sourceTitle,sourceId)
+
+# iterating over the translated pages, whose downloads are submitted in advance to the thread pool :
+# the target page, the categories and the sources of a page are fetched concurrently, and at most fetchWindow pages are pending
+# the API requests of the pending pages are gathered by batches, which are sent when they are full or when the first of their pages is yielded
+# the source articles of the rejected triples (see prefilterTranslations()) are not downloaded
+# yields (n, talkTitle, targetTitle, triples, checkpoint, fetches) in dump order, fetches being a dict of futures, with the dict of the rejected triples (see prefilterWindow())
+def fetchTranslations(translations,executor,graph,targetSource):
+	pending=collections.deque()
+	for (n,talkTitle,targetTitle,triples,checkpoint,rejected) in translations:
+		fetches={'rejected':rejected}
+		batched=[]
+		fetches['target']=submitTarget(executor,batched,targetTitle,triples,targetSource)
+		fetches['cats']=executor.submit(fetchCategories,graph,targetTitle)
+		for triple in triples:
+			if len(triple[0])<=3 and triple[:3] not in fetches and triple[:3] not in rejected:
+				fetches[triple[:3]]=submitSource(executor,batched,*triple[:3])
+		pending.append((batched,(n,talkTitle,targetTitle,triples,checkpoint,fetches)))
+		if len(pending)>=fetchWindow:
+			(batched,translation)=pending.popleft()
+			flushBatches(batched)
+			yield translation
+	while pending:
+		(batched,translation)=pending.popleft()
+		flushBatches(batched)
+		yield translation
+
+# iterating over the talk pages of the dump that contain a translation mark : yields (n, talkTitle, targetTitle, triples, checkpoint)
+# the time spent waiting for the scanning processes is recorded as the scan stage
+# the scan begins at the checkpoint start, and each page is yielded with the checkpoint of the beginning of its chunk
+# when the articles are indexed (in index), the scan begins at the checkpoint of the indexing, and the pages before start are only indexed
+def findTranslations(processedPages,regexTrans,progress,start,index=None,indexStart=(0,0)):
+	scanStart=start if index is None else indexStart
+	pages=scanDump(targetLang+wikidumpName,talkNameSpace[targetLang],translationMarks[targetLang],nbScanWorkers,scanChunkSize,scanQueueSize,progress,scanStart,index)
+	while True:
+		with metrics.timer('scan'):
+			page=next(pages,None)
+		if page is None:
+			break
+		(n,talkTitle,textWithMark)=page
+		if n<=start[1]:
+			continue
+		m= re.match(talkNameSpace[targetLang]+r'\s*:(.*)',talkTitle)
+		targetTitle=m.group(1)
+		if targetTitle in processedPages:
+			# if already processed : skip and jump to next page
+			continue
+		
+		# looking for translation mark
+		with metrics.timer('marks'):
+			triples=extractTranslationMark(textWithMark,regexTrans)
+		
+		# if a translation mark has been found
+		if triples:
+			metrics.count('translations')
+			yield (n,talkTitle,targetTitle,triples,progress['chunk'])
+
+# gauges of the metrics computed from the progress of the scan (speed and ETA), the cache and the API sources,
+# and start of the periodic writing of the metrics
+def startProgressMetrics(progress,graph):
+	startTime=time.time()
+	def pagesPerSecond():
+		return progress.get('pages',0)/max(time.time()-startTime,1e-6)
+	def eta():
+		if not progress.get('bytes') or not progress.get('size'):
+			return None
+		return (time.time()-startTime)*(progress['size']-progress['bytes'])/progress['bytes']
+	def apiRequests():
+		return graph.nbQueries+sum(source.throttle.nbRequests for source in list(revisionSources.values()) if isinstance(source,ApiSource))
+	metrics.gauge('pages_scanned',lambda: progress.get('pages',0))
+	metrics.gauge('pages_per_second',pagesPerSecond)
+	metrics.gauge('dump_bytes_read',lambda: progress.get('bytes',0))
+	metrics.gauge('dump_bytes_total',lambda: progress.get('size'))
+	metrics.gauge('eta_seconds',eta)
+	metrics.gauge('cache_hits',lambda: cache.hits)
+	metrics.gauge('cache_misses',lambda: cache.misses)
+	metrics.gauge('api_requests',apiRequests)
+	metrics.gauge('api_batches',lambda: sum(batcher.nbBatches for batcher in list(batchers.values())))
+	metrics.start()
+
+# length prefilter of the translations, read by windows of apiBatchSize pages : the sizes of the texts of a window are queried at once
+# (the target ones in the source of the target articles, the source ones only in the API, as the other sources are not downloaded),
+# and each translation is yielded with the dict of its triples whose source article is not to be downloaded, with their estimated wordLengthDiff
+def prefilterTranslations(translations,targetSource,lengthModel):
+	window=[]
+	for translation in translations:
+		window.append(translation)
+		if len(window)>=max(apiBatchSize,1):
+			for result in prefilterWindow(window,targetSource,lengthModel):
+				yield result
+			window=[]
+	for result in prefilterWindow(window,targetSource,lengthModel):
+		yield result
+
+def prefilterWindow(window,targetSource,lengthModel):
+	# the requests of the window : titles of the targets, and (title, revid) of the sources for each language
+	targets=set()
+	requests={}
+	if estimateWords(lengthModel,targetLang,0) is not None:
+		for (n,talkTitle,targetTitle,triples,checkpoint) in window:
+			for triple in triples:
+				if prefilterApplies(triple,lengthModel):
+					targets.add(urllib.parse.unquote(targetTitle))
+					requests.setdefault(triple[0],set()).add((urllib.parse.unquote(triple[1]),triple[2]))
+	targetSizes={}
+	sourceSizes={}
+	try:
+		with metrics.timer('prefilter'):
+			if targets:
+				targetSizes=targetSource.querySizes([(title,'') for title in targets])
+			for (sourceLang,sourceRequests) in requests.items():
+				sourceSizes[sourceLang]=getRevisionSource(sourceLang).querySizes(sourceRequests)
+	except:
+		printLog("Error while querying the sizes of the texts")
+	for (n,talkTitle,targetTitle,triples,checkpoint) in window:
+		rejected={}
+		targetSize=targetSizes.get((urllib.parse.unquote(targetTitle),''))
+		for triple in triples:
+			sourceSize=sourceSizes.get(triple[0],{}).get((urllib.parse.unquote(triple[1]),triple[2]))
+			if targetSize is None or sourceSize is None:
+				continue
+			nWords1=estimateWords(lengthModel,targetLang,targetSize)
+			nWords2=estimateWords(lengthModel,triple[0],sourceSize)
+			estimatedDiff=calcDiff(nWords1,nWords2,getLangRatio(triple[0]))
+			if prefilterRejects(estimatedDiff,triple[3] if len(triple)==4 else 0):
+				rejected[triple[:3]]=estimatedDiff
+				metrics.count('prefilterRejects')
+		yield (n,talkTitle,targetTitle,triples,checkpoint,rejected)
+
+# the prefilter applies to the sources read in the API, whose language ratio is known, and when the target text is the current one
+def prefilterApplies(triple,lengthModel):
+	if len(triple[0])>3 or len(triple)==4 and triple[3]:
+		return False
+	return estimateWords(lengthModel,triple[0],0) is not None and isinstance(getRevisionSource(triple[0]),ApiSource)
+
+# a pair is rejected when no wordLengthDiff within prefilterMargin of the estimated one matches, and when the first revision,
+# which may change the texts, cannot be searched (the decision is tested on the interval, by steps of a twentieth)
+def prefilterRejects(estimatedDiff,revId):
+	low=estimatedDiff-prefilterMargin
+	high=estimatedDiff+prefilterMargin
+	if revId==0 and max(abs(low),abs(high))>revisionSearchThreshold:
+		return False
+	return not any(wordLengthDiffMatches(low+(high-low)*k/20) for k in range(21))
+
+# estimated number of words of a text of size bytes, with the bytes per word ratio of the language,
+# or None while the ratio has been measured on less than minModelTexts texts
+def estimateWords(lengthModel,lang,size):
+	if not lang+"\ttexts" in lengthModel or lengthModel[lang+"\ttexts"]<minModelTexts:
+		return None
+	return size*lengthModel[lang+"\twords"]/lengthModel[lang+"\tbytes"]
+
+# measure of the bytes per word ratio of a language, on the texts that are downloaded and cleaned
+def recordLength(lengthModel,lang,size,nWords):
+	if size>0 and nWords>0:
+		lengthModel.add(lang+"\tbytes",size)
+		lengthModel.add(lang+"\twords",nWords)
+		lengthModel.add(lang+"\ttexts",1)
+
+# ratio of the word counts of a source language and of the target language
+def getLangRatio(sourceLang):
+	if sourceLang in wordCountRef.keys() and targetLang in wordCountRef.keys():
+		return wordCountRef[sourceLang]/wordCountRef[targetLang]
+	return 1
+
+# updating the stats of a pair, and marking the target page as processed
+def updateStats(stats,statsPerCat,processedPages,sourceLang,targetTitle,nWords1,nbTriples,superCats):
+	# simple statistics of link counts by source language
+	stats.add(sourceLang,1)
+
+	# updating statsPerCat
+	statsPerCat.add(sourceLang+"\t*",nWords1/nbTriples)
+	#~ print("Searching top categories")
+	for (cat,weight) in superCats.items():
+		statsPerCat.add(sourceLang+"\t"+cat,nWords1/nbTriples*weight)
+		#~ printLog(sourceLang+"\t"+cat+"\t"+str(nWords1)+"\t"+str(nbTriples))
+	# mark the page as processed
+	processedPages[targetTitle]=1
+	metrics.count('processed')
+
 def calcDiff(nWords1,nWords2,LangRatio):
 	if nWords1!=0 or nWords2!=0:
 		return 2*(nWords1/translationRatio-nWords2/LangRatio)/(nWords1/translationRatio+nWords2/LangRatio)
@@ -675,70 +1174,84 @@ def wordLengthDiffMatches(wordLengthDiff):
 	return (wordLengthDiff >= -1* diffThreshold and wordLengthDiff <= diffThreshold)
 	
 #**************************************************************************** 
-# arg1 : processedPages - a hash (recorded in a shelve) that record the title of the already processed pages for a given dump
-# arg2 : mwSites - a hash containing the mwclient.Site objects for each language
-# arg3 : stats - a hash (recorded in a shelve) containing the stats (word numbers and article numbers) for [target][source] language pairs
-# arg3 : statsPerCat - a hash (recorded in a shelve) containing the stats (word numbers) for [target][source] language pairs
+# arg1 : processedPages - a hash (recorded in the state file) that record the title of the already processed pages for a given dump
+# arg2 : revisionSources - a hash containing the revision sources (local dumps or API) for each language
+# arg3 : stats - a hash (recorded in the state file) containing the stats (word numbers and article numbers) for [target][source] language pairs
+# arg3 : statsPerCat - a hash (recorded in the state file) containing the stats (word numbers) for [target][source] language pairs, by category
 # arg4 : firstRevisionIdHash - a hash containing, for a given title, the id of the first revision that contains the translation
-# arg5 : parentCats - a hash, recorded in a shelves, recording the parent categories for each article / category page
+# arg5 : parentCats - a hash, recorded in the state file, recording the parent categories for each article / category page
 # arg6 : targetLang - a string (e.g. 'fr') which indicates the language of the dump.xml file to process
 # arg7 : wordLengthDiffFile - a file to record all diff in order to study the diff distribution
+# arg8 : state - the state store of the tables, whose commits are done between two pages
+# arg9 : checkpoints - a hash (recorded in the state file) that records, for each dump, the checkpoint (offset, number of pages)
+#        before which all the pages have been processed
+# arg10 : lengthModel - counters (recorded in the state file) of the bytes and words of the processed texts of each language, for the length prefilter
 
-def processDump(processedPages,mwSites,stats,statsPerCat,firstRevisionIdHash,parentCats,targetLang,wordLengthDiffFile):
+def processDump(processedPages,revisionSources,stats,statsPerCat,firstRevisionIdHash,parentCats,targetLang,wordLengthDiffFile,state,checkpoints,lengthModel):
 	n=0
 	
+	# the checkpoints are recorded for a given dump file (name and size), and for the kind of scan (the offsets of a scan
+	# by streams are offsets in the compressed file)
+	dumpFileName=targetLang+wikidumpName
+	dumpKey=os.path.basename(dumpFileName)+"\t"+str(os.path.getsize(dumpFileName))
+	if isMultistream(dumpFileName):
+		dumpKey+="\tmultistream"
+	start=(0,0)
+	if resumeFromCheckpoint and dumpKey in checkpoints:
+		start=checkpoints[dumpKey]
+		print("Resuming the scan at offset",start[0],"after",start[1],"pages")
+	lastCheckpoint=start
+	
 	# loading the site objects
-	mwSites[targetLang] = mwclient.Site(targetLang+'.wikipedia.org')
+	revisionSources[targetLang] = openRevisionSource(targetLang)
 	pwSite=pw.Site(targetLang, 'wikipedia')
+	graph=openCategoryGraph(parentCats,pwSite,targetLang)
 	
 	regexTrans=re.compile(translationMarks[targetLang]+r'(.*?)\}\}',flags=re.S|re.I)
 	
-	# iterating over dump in target language
-	# NB : iterate function has been modified to cover all the namespaces
-	for targetTitle, targetText in iterate(targetLang+wikidumpName):
-		n+=1
-		if n % 10000 == 0:
-			print (n,targetTitle)
-		
-		# selection of Talk page
-		m= re.match(talkNameSpace[targetLang]+r'\s*:(.*)',targetTitle)
-		talkTitle=targetTitle
-		if m:
-			targetTitle=m.group(1)
-			textWithMark=targetText
-			if targetTitle in processedPages.keys():
-				# if already processed : skip and jump to next page
-				continue
+	# iterating over the talk pages of the dump in target language that contain a translation mark
+	# the dump is scanned by nbScanWorkers processes, and the pages are downloaded by nbFetchThreads threads
+	progress={}
+	startProgressMetrics(progress,graph)
+	if targetFromDump and (isMultistream(dumpFileName) or not dumpFileName.endswith('.bz2')):
+		# first phase : the whole scan, then the target articles are read in the dump
+		if isMultistream(dumpFileName):
+			articleIndex=None
+			translations=list(findTranslations(processedPages,regexTrans,progress,start))
 		else:
-			# if not a talk page : skip and jump to next page
-			continue
-		
-		# looking for translation mark
-		triples=extractTranslationMark(textWithMark,regexTrans)
-		
-		# if a translation mark has been found
-		if triples:
-			# loading the Page object (mwclient)
-			try:
-				page=mwclient.page.Page(mwSites[targetLang],urllib.parse.unquote(targetTitle)).resolve_redirect()
-				cleanedTargetText=clean(page.text())
-			except:
-				print("Error while downloading page",targetTitle)
+			articleIndex=StateStore(dumpFileName+'.articles.sqlite',autoCommit=False)
+			translations=indexTranslations(processedPages,regexTrans,progress,start,articleIndex)
+		targetSource=openScannedDump(dumpFileName,articleIndex)
+	else:
+		articleIndex=None
+		if targetFromDump:
+			print("The articles of a compressed dump cannot be read by offset : the target articles are read in the revision source")
+		translations=findTranslations(processedPages,regexTrans,progress,start)
+		targetSource=revisionSources[targetLang]
+	if lengthPrefilter:
+		translations=prefilterTranslations(translations,targetSource,lengthModel)
+	else:
+		translations=((n,talkTitle,targetTitle,triples,checkpoint,{}) for (n,talkTitle,targetTitle,triples,checkpoint) in translations)
+	with concurrent.futures.ThreadPoolExecutor(nbFetchThreads) as executor:
+		for (n,talkTitle,targetTitle,triples,checkpoint,fetches) in fetchTranslations(translations,executor,graph,targetSource):
+			# all the pages before the chunk of the current page have been processed : the checkpoint is recorded,
+			# and the state is committed only here, between two pages, so that the checkpoint, the processed pages
+			# and the stats are committed together (the pages of the chunk processed before a crash are skipped at restart)
+			if checkpoint!=lastCheckpoint:
+				checkpoints[dumpKey]=checkpoint
+				lastCheckpoint=checkpoint
+			state.commitIfDue()
+			# loading the Page object (the time spent waiting for the fetching threads is recorded as the wait stage)
+			with metrics.timer('wait'):
+				target=fetches['target'].result()
+			if target is None:
 				continue
-	
-			# Searching current article ID
-			revs=page.revisions(prop="ids",dir='older')
-			try:
-				rev=revs.next()
-				targetId=str(rev['revid'])
-			except:
-				targetId=""
+			(page,cleanedTargetText,targetId,revTexts,targetSize)=target
+			recordLength(lengthModel,targetLang,targetSize,countWords(cleanedTargetText))
 
 			printLog('page',str(n),':',targetTitle,"("+targetId+")")
-			if targetLang in topCats.keys():
-				superCats=findSuperCats(topCats[targetLang],supraCats[targetLang],parentCats,pwSite,targetTitle)
-			else:
-				superCats=findParentCat(parentCats,pwSite,targetTitle)
+			with metrics.timer('wait'):
+				superCats=fetches['cats'].result()
 			
 			# for each source 
 			for triple in triples:
@@ -750,94 +1263,94 @@ def processDump(processedPages,mwSites,stats,statsPerCat,firstRevisionIdHash,par
 				if len(triple)==4:
 					revId=triple[3]
 					if revId:
-						revs=page.revisions(prop='content|ids',startid=revId,dir='newer')
-						try:
-							rev=revs.next()
-							cleanedTargetText=clean(rev['*'])
+						if revTexts[revId] is not None:
+							cleanedTargetText=revTexts[revId]
 							print("Using revId=",revId)
-						except:
+						else:
 							print("Bad revId=",revId)
 				if len(sourceLang)<=3:
 
-					# looking for source page
-					if not sourceLang in mwSites.keys():
-						print("Opening",sourceLang+'.wikipedia.org')
-						try:
-							mwSites[sourceLang]= mwclient.Site(sourceLang+'.wikipedia.org')
-						except:
-							printLog("impossible to load wiki for language",sourceLang)
+					# the pair cannot match according to the sizes of the texts : the source is not downloaded, the stats are updated
+					# and the estimated wordLengthDiff is recorded, as for the downloaded pairs
+					if triple[:3] in fetches['rejected']:
+						wordLengthDiff=fetches['rejected'][triple[:3]]
+						updateStats(stats,statsPerCat,processedPages,sourceLang,targetTitle,countWords(cleanedTargetText),len(triples),superCats)
+						wordLengthDiffFile.write(str(wordLengthDiff)+"\n")
+						printLog(sourceLang,"->",targetLang," : wordLengthDiff="+str(wordLengthDiff)+" (estimated, rejected by the length prefilter)")
+						continue
 
 					# recording the text pair if length matches
-					if sourceLang in mwSites.keys():
-						(sourceText,timestamp)=getArticleByTitleAndId(mwSites[sourceLang],sourceTitle,sourceId)
+					with metrics.timer('wait'):
+						source=fetches[triple[:3]].result()
+					if source is not None:
+						(sourceText,timestamp)=source
 						cleanedSourceText=clean(sourceText)
 						# words2 = source, words1 = target
 						nWords2=countWords(cleanedSourceText)
 						nWords1=countWords(cleanedTargetText)
+						recordLength(lengthModel,sourceLang,len(sourceText.encode('utf8')),nWords2)
 						if nWords2==0 and nWords1==0:
 							printLog("Error : 0 length texts")
 							continue
 						
-						langRatio=1
-						if sourceLang in wordCountRef.keys() and targetLang in wordCountRef.keys():
-							langRatio=wordCountRef[sourceLang]/wordCountRef[targetLang]
+						langRatio=getLangRatio(sourceLang)
 						wordLengthDiff=calcDiff(nWords1,nWords2,langRatio)  
 						
 						# if revId is unknown and  the word length are two different, looking for the first revision with translation
-						if abs(wordLengthDiff)>0.15 and revId==0:
+						if abs(wordLengthDiff)>revisionSearchThreshold and revId==0:
 							# looking for initial version of translation
 							#~ print("Searching initial version of translation")
 							
-							talkPage=mwclient.page.Page(mwSites[targetLang],urllib.parse.unquote(talkTitle)).resolve_redirect()
-							firstRevisionTimestamp=getFirstRevisionWithTranslationMarkup(firstRevisionIdHash,talkTitle,talkPage,translationMarks[targetLang],sourceTitle,timestamp)
+							with metrics.timer('revisionSearch'):
+								talkPage=revisionSources[targetLang].page(urllib.parse.unquote(talkTitle))
+								firstRevisionTimestamp=getFirstRevisionWithTranslationMarkup(firstRevisionIdHash,talkTitle,talkPage,translationMarks[targetLang],sourceTitle,timestamp)
 							
 							if firstRevisionTimestamp:
+								# the page of the revision source is opened when the current revision has been read elsewhere
+								# (in the scanned dump, which has only the current revisions, or by a batched query)
+								if page is None:
+									with metrics.timer('revisionSearch'):
+										page=revisionSources[targetLang].page(urllib.parse.unquote(targetTitle))
 								revs=page.revisions(prop='content|ids|timestamp',start=firstRevisionTimestamp,dir='newer') 
 								#~ print("Timestamp",firstRevisionTimestamp)
+								# only the lookup of the revision may fail (no revision after the timestamp, no content, or a download error)
+								firstRevisionText=None
 								try :
-									rev=revs.next()
+									with metrics.timer('revisionSearch'):
+										rev=next(revs)
 									firstRevisionText=rev['*']
+								except Exception as e:
+									printLog("Failed to find first revision :",repr(e))
+								if firstRevisionText is not None:
 									initTargetText=clean(firstRevisionText)
 									if initTargetText!="":
 										cleanedTargetText=initTargetText
 									nWords1=countWords(cleanedTargetText)
 									
 									# get initial version ID
-									if targetTitle in firstRevisionIdHash.keys():
+									if targetTitle in firstRevisionIdHash:
 										targetId=firstRevisionIdHash[targetTitle]
 									
 									# if the first revision has a timestamp than it is possible to find the corresponding version of source text
 									if not sourceId and firstRevisionTimestamp:
-										sourceText=getArticleByTitleAndTimestamp(mwSites[sourceLang],sourceTitle,firstRevisionTimestamp)
-										cleanedSourceText=clean(sourceText)
-										nWords2=countWords(cleanedSourceText)
-										printLog("A corresponding version of source text has been found !")
+										sourceText=None
+										try :
+											with metrics.timer('fetchSource'):
+												sourceText=getArticleByTitleAndTimestamp(revisionSources[sourceLang],sourceTitle,firstRevisionTimestamp)
+										except Exception as e:
+											printLog("Failed to find the corresponding version of source text :",repr(e))
+										if sourceText is not None:
+											cleanedSourceText=clean(sourceText)
+											nWords2=countWords(cleanedSourceText)
+											printLog("A corresponding version of source text has been found !")
 									if nWords2==0 and nWords1==0:
 										printLog("Error : 0 length texts")
 										continue
-									wordLengthDiff= calcDiff(nWords1,nWords2,LangRatio)
-								except :
-									printLog("Failed to find first revision")
+									wordLengthDiff=calcDiff(nWords1,nWords2,langRatio)
 
 								
 						# UPDATING stats
-						# simple statistics of link counts by source language
-						if not (sourceLang) in stats.keys():
-							stats[sourceLang]=0
-						stats[sourceLang]+=1
-
-						# updating statsPerCat
-						if not (sourceLang+"\t*") in statsPerCat.keys():
-							statsPerCat[sourceLang+"\t*"]=0
-						statsPerCat[sourceLang+"\t*"]+=nWords1/len(triples)
-						#~ print("Searching top categories")
-						for cat in superCats:
-							if (sourceLang+"\t"+cat) not in statsPerCat.keys():
-								statsPerCat[sourceLang+"\t"+cat]=0
-							statsPerCat[sourceLang+"\t"+cat]+=nWords1/len(triples)
-							#~ printLog(sourceLang+"\t"+cat+"\t"+str(nWords1)+"\t"+str(len(triples)))
-						# mark the page as processed
-						processedPages[targetTitle]=1
+						updateStats(stats,statsPerCat,processedPages,sourceLang,targetTitle,nWords1,len(triples),superCats)
 					
 
 						wordLengthDiffFile.write(str(wordLengthDiff)+"\n")
@@ -850,32 +1363,82 @@ def processDump(processedPages,mwSites,stats,statsPerCat,firstRevisionIdHash,par
 							print ("Recording",name,"for",sourceLang+"-"+targetLang)
 							
 							outPath=outputPath+"/"+sourceLang+"-"+targetLang+"/"
-							if not os.path.isdir(outPath):
-								os.mkdir(outPath)
-							
-							with open(outPath+name+".2."+sourceLang+".txt",encoding='utf8',mode='w') as src_out:
-								src_out.write("Title:"+sourceTitle+"\n")
-								src_out.write("Id:"+sourceId+"\n")
-								src_out.write(cleanedSourceText)
-							with open(outPath+name+".2."+targetLang+".txt",encoding='utf8',mode='w') as tgt_out:
-								tgt_out.write("Title:"+targetTitle+"\n")
-								tgt_out.write("Id:"+targetId+"\n")
-								tgt_out.write(cleanedTargetText)
-	return n
+							with metrics.timer('write'):
+								if not os.path.isdir(outPath):
+									os.mkdir(outPath)
+								
+								with open(outPath+name+".2."+sourceLang+".txt",encoding='utf8',mode='w') as src_out:
+									src_out.write("Title:"+sourceTitle+"\n")
+									src_out.write("Id:"+sourceId+"\n")
+									src_out.write(cleanedSourceText)
+								with open(outPath+name+".2."+targetLang+".txt",encoding='utf8',mode='w') as tgt_out:
+									tgt_out.write("Title:"+targetTitle+"\n")
+									tgt_out.write("Id:"+targetId+"\n")
+									tgt_out.write(cleanedTargetText)
+							metrics.count('recorded')
+	# end of the dump
+	checkpoints[dumpKey]=progress['end']
+	if targetSource is not revisionSources[targetLang]:
+		targetSource.close()
+	if articleIndex is not None:
+		articleIndex.close()
+	return progress['pages']
+
+# first phase for an uncompressed dump : returns the list of the translations found by the scan, which indexes the articles of the dump
+# in the articles table of articleIndex (DUMP.articles.sqlite, in the format of indexPages()) when the index is not complete
+# the indexing scan is checkpointed in the index file, with the translations found before its checkpoint (in the translations table),
+# so that a run interrupted during the first phase resumes the indexing at its checkpoint
+def indexTranslations(processedPages,regexTrans,progress,start,articleIndex):
+	articles=articleIndex.table('articles')
+	if '\tcomplete' in articles:
+		return list(findTranslations(processedPages,regexTrans,progress,start))
+	found=articleIndex.table('translations')
+	indexStart=articles.get('\tcheckpoint',(0,0))
+	if indexStart==(0,0):
+		print("Indexing the articles of",targetLang+wikidumpName)
+	else:
+		print("Resuming the indexing of the articles at offset",indexStart[0],"after",indexStart[1],"pages")
+	# the translations found before the checkpoint of the indexing (the pages of its chunk are scanned again)
+	translations=sorted((translation for (key,translation) in found.items() if start[1]<translation[0]<=indexStart[1] and translation[2] not in processedPages),key=lambda translation: translation[0])
+	for translation in findTranslations(processedPages,regexTrans,progress,start,articles,indexStart):
+		translations.append(translation)
+		found[str(translation[0])]=translation
+		articles['\tcheckpoint']=translation[4]
+		articleIndex.commitIfDue()
+	articles['\tcomplete']=True
+	articleIndex.commit()
+	return translations
+
+# opening the scanned dump as the source of the target articles, once the index built by the scan is complete
+# (a multistream dump has its own index)
+def openScannedDump(dumpFileName,articleIndex):
+	if articleIndex is None:
+		return DumpSource(targetLang,[dumpFileName])
+	return DumpSource(targetLang,[dumpFileName],{dumpFileName:articleIndex.table('articles')})
 
 #**************************************************************** MAIN
 
-with shelve.open(outputPath+'/parentCats.'+targetLang) as parentCats:
-	with shelve.open(outputPath+'/statsPerCat.'+targetLang) as statsPerCat:
-		with shelve.open(outputPath+'/stats.'+targetLang) as stats:
-			with shelve.open(outputPath+'/processed.'+targetLang) as processedPages:
-				with shelve.open(outputPath+'/firstRevisionId.'+targetLang) as firstRevisionIdHash:
-					with open(outputPath+'/wordLengthDiff.'+targetLang+".txt",mode='a') as wordLengthDiffFile:
-						wordLengthDiffFile.write("------------------------------------\n")
-						n=processDump(processedPages,mwSites,stats,statsPerCat,firstRevisionIdHash,parentCats,targetLang,wordLengthDiffFile)
-						print(n,"pages has been processed!")
-						#~ for lang_cat in statsPerCat.keys():
-						#~ 	print (lang_cat,"=>",statsPerCat[lang_cat])
+# the state of the run (formerly recorded in shelves, see stateStore.py for the migration)
+state=StateStore(outputPath+'/state.'+targetLang+'.sqlite',autoCommit=False)
+parentCats=state.table('parentCats')
+statsPerCat=state.counters('statsPerCat' if categoryMode=='walk' else 'statsPerCatDistribution')
+stats=state.counters('stats')
+processedPages=state.table('processed')
+firstRevisionIdHash=state.table('firstRevisionId')
+checkpoints=state.table('checkpoints')
+lengthModel=state.counters('lengthModel')
+with open(outputPath+'/wordLengthDiff.'+targetLang+".txt",mode='a') as wordLengthDiffFile:
+	wordLengthDiffFile.write("------------------------------------\n")
+	n=processDump(processedPages,revisionSources,stats,statsPerCat,firstRevisionIdHash,parentCats,targetLang,wordLengthDiffFile,state,checkpoints,lengthModel)
+	print(n,"pages has been processed!")
+	print("Cache :",cache.hits,"hits,",cache.misses,"misses")
+	#~ for lang_cat in statsPerCat.keys():
+	#~ 	print (lang_cat,"=>",statsPerCat[lang_cat])
 
+for batcher in batchers.values():
+	batcher.close()
+metrics.close()
+state.close()
+cache.close()
 log.close()
     
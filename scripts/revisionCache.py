@@ -0,0 +1,152 @@
+# -*- coding:utf8 -*-
+
+"""
+Persistent cache for the fetched revisions, the cleaned texts and the category lookups
+
+The values are pickled, compressed with zlib and recorded in a sqlite file, addressed by the sha1 of their content :
+a key (e.g. lang, title, revid) points to a content, so that identical contents are recorded only once.
+When the total size of the contents goes over maxSize, the least recently used contents are evicted.
+The cache can be shared by several threads, and by several processes (e.g. the processes of a shared run of several target
+languages) : the file is opened in WAL mode, every put is committed at once (the access times of the read contents are kept
+in memory until the next put, so that no transaction remains open), and a process claims a missing key before fetching its value,
+so that the other processes wait for the value in the cache instead of fetching it again (see claim() and wait()).
+
+Usage :
+	cache=RevisionCache(fileName,maxSize)
+	value=cache.get(('rev',lang,title,revid))
+	if value is None:
+		value=...
+		cache.put(('rev',lang,title,revid),value)
+	cache.close()
+
+	if cache.claim(key):
+		value=...
+		cache.put(key,value)	# or cache.release(key) when there is no value
+	else:
+		value=cache.wait(key,timeout)
+"""
+
+import hashlib
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+claimTimeout=300 # delay (in seconds) after which the claim of a process is considered as abandoned
+waitInterval=0.5 # interval (in seconds) between two readings of a claimed key
+
+
+class RevisionCache:
+	def __init__(self,fileName,maxSize=10*1024**3):
+		self.maxSize=maxSize
+		self.lock=threading.RLock()
+		self.db=sqlite3.connect(fileName,timeout=60,check_same_thread=False)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS contents (hash TEXT PRIMARY KEY, data BLOB, size INTEGER, lastAccess REAL)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, hash TEXT)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS contentsByAccess ON contents (lastAccess)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS keysByHash ON keys (hash)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, owner TEXT, time REAL)")
+		self.db.commit()
+		self.size=self.db.execute("SELECT COALESCE(SUM(size),0) FROM contents").fetchone()[0]
+		self.accessed={}
+		self.owner=socket.gethostname()+":"+str(os.getpid())
+		self.hits=0
+		self.misses=0
+
+	# the keys are tuples of strings (or numbers), joined with tabs
+	def keyString(self,key):
+		return "\t".join(str(k) for k in key)
+
+	# returns the cached value, or None when the key is not in the cache
+	def get(self,key):
+		with self.lock:
+			return self.getLocked(key)
+
+	def getLocked(self,key):
+		row=self.db.execute("SELECT contents.hash,data FROM keys JOIN contents ON keys.hash=contents.hash WHERE key=?",(self.keyString(key),)).fetchone()
+		if row is None:
+			self.misses+=1
+			return None
+		self.hits+=1
+		self.accessed[row[0]]=time.time()
+		return pickle.loads(zlib.decompress(row[1]))
+
+	def put(self,key,value):
+		data=zlib.compress(pickle.dumps(value))
+		contentHash=hashlib.sha1(data).hexdigest()
+		with self.lock:
+			self.putLocked(key,data,contentHash)
+
+	def putLocked(self,key,data,contentHash):
+		self.writeAccesses()
+		# the content may be recorded by another process at the same time
+		if self.db.execute("INSERT OR IGNORE INTO contents VALUES (?,?,?,?)",(contentHash,data,len(data),time.time())).rowcount>0:
+			self.size+=len(data)
+		self.db.execute("INSERT OR REPLACE INTO keys VALUES (?,?)",(self.keyString(key),contentHash))
+		# the processes that wait for a claimed key read its value as soon as it is committed
+		self.db.execute("DELETE FROM claims WHERE key=?",(self.keyString(key),))
+		self.db.commit()
+		if self.size>self.maxSize:
+			self.evict()
+
+	# claim of a missing key, before fetching its value : returns False when the key is claimed by another process
+	# (since less than claimTimeout seconds), which is fetching the value
+	def claim(self,key):
+		with self.lock:
+			now=time.time()
+			# a single statement, so that two processes cannot claim the same key
+			claimed=self.db.execute("INSERT INTO claims VALUES (?,?,?) ON CONFLICT (key) DO UPDATE SET owner=excluded.owner,time=excluded.time "
+				+"WHERE owner=excluded.owner OR time<?",(self.keyString(key),self.owner,now,now-claimTimeout)).rowcount>0
+			self.db.commit()
+			return claimed
+
+	# giving up the claim of a key whose value has not been found
+	def release(self,key):
+		with self.lock:
+			self.db.execute("DELETE FROM claims WHERE key=? AND owner=?",(self.keyString(key),self.owner))
+			self.db.commit()
+
+	# waiting for the value of a key claimed by another process : returns the value, or None when the claim has been released
+	# or abandoned, or after timeout seconds (the key can then be claimed)
+	def wait(self,key,timeout):
+		end=time.time()+timeout
+		keyString=self.keyString(key)
+		while time.time()<end:
+			time.sleep(waitInterval)
+			with self.lock:
+				value=self.getLocked(key)
+				if value is not None:
+					return value
+				row=self.db.execute("SELECT time FROM claims WHERE key=?",(keyString,)).fetchone()
+				if row is None or time.time()-row[0]>=claimTimeout:
+					return None
+		return None
+
+	# removing the least recently used contents (and their keys) until the size is 10% under the max size
+	def evict(self):
+		# the contents may have been added by other processes
+		self.size=self.db.execute("SELECT COALESCE(SUM(size),0) FROM contents").fetchone()[0]
+		for (contentHash,size) in self.db.execute("SELECT hash,size FROM contents ORDER BY lastAccess").fetchall():
+			if self.size<=0.9*self.maxSize:
+				break
+			self.db.execute("DELETE FROM keys WHERE hash=?",(contentHash,))
+			self.db.execute("DELETE FROM contents WHERE hash=?",(contentHash,))
+			self.size-=size
+		self.db.commit()
+
+	# recording the access times of the contents read since the last write
+	def writeAccesses(self):
+		if self.accessed:
+			self.db.executemany("UPDATE contents SET lastAccess=? WHERE hash=?",[(t,h) for (h,t) in self.accessed.items()])
+			self.accessed={}
+
+	def close(self):
+		with self.lock:
+			self.writeAccesses()
+			self.db.commit()
+			self.db.close()
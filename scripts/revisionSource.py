@@ -0,0 +1,458 @@
+# -*- coding:utf8 -*-
+
+"""
+Revision sources : where the texts and the revisions of the articles are read
+
+Every source gives access to a page through source.page(title), after redirect resolution.
+The returned object implements the part of the mwclient.page.Page interface used by processDump.py :
+page.name, page.exists, page.text() and page.revisions(prop,startid,endid,start,end,dir)
+
+	ApiSource    : the wikipedia API, through mwclient
+	DumpSource   : local uncompressed xml dumps (pages-articles for the current texts, stub or history dumps
+	               for the revisions), with an on-disk title -> offset index, or multistream bz2 dumps with their index
+	MemorySource : a stand-in source filled with a dict, to run the pipeline without network access
+
+The API requests of many pages can also be gathered by a RevisionBatcher, which sends them by batched queries
+(up to 50 revision ids or titles by query, the redirects being resolved by the API in the same query).
+"""
+
+import concurrent.futures
+import dbm
+import shelve
+import threading
+import time
+
+from dumpReader import indexPages,readText,readTextSize,isMultistream,MultistreamDump
+
+# mwclient and requests are only required by ApiSource
+try:
+	import mwclient
+except ImportError:
+	mwclient=None
+try:
+	import requests
+except ImportError:
+	requests=None
+
+maxRedirects=5 # max length of a redirect chain
+batchSize=50 # max number of titles or revision ids in a batched API query
+
+
+# title as recorded by the API and in the dumps : with spaces and a capital first letter
+def normalizeTitle(title):
+	title=title.replace('_',' ')
+	return title[:1].upper()+title[1:]
+
+# title reached by following the normalizations and redirects of an API answer (dict title -> title)
+def resolveAlias(aliases,title):
+	nbRedirects=0
+	while title in aliases and nbRedirects<=maxRedirects:
+		title=aliases[title]
+		nbRedirects+=1
+	return title
+
+# conversion of a timestamp (struct_time or ISO 8601 string) into a comparable tuple
+def timeKey(timestamp):
+	if isinstance(timestamp,str):
+		timestamp=time.strptime(timestamp,'%Y-%m-%dT%H:%M:%SZ')
+	return tuple(timestamp)[:6]
+
+
+class RevisionSource:
+	lang=None
+
+	# returns the page object for a given title (redirects are resolved)
+	def page(self,title):
+		raise NotImplementedError
+
+	# sizes in bytes of the texts of the revisions (title, revid), revid being empty for the current revision (or when the revision
+	# does not exist) : returns a dict (title, revid) -> size for the pages that exist
+	def querySizes(self,requests):
+		sizes={}
+		for (title,revid) in requests:
+			page=self.page(title)
+			if not page.exists:
+				continue
+			text=None
+			if str(revid).isdigit():
+				for rev in page.revisions(prop='ids|content',startid=revid,endid=revid):
+					text=rev.get('*')
+			if text is None:
+				text=page.text()
+			sizes[(title,revid)]=len(text.encode('utf8'))
+		return sizes
+
+
+# limitation of the number of simultaneous requests to a host, and of the request rate (min interval in seconds)
+# nbRequests counts the requests made through the throttle
+class Throttle:
+	def __init__(self,maxConcurrency,minInterval):
+		self.semaphore=threading.BoundedSemaphore(maxConcurrency)
+		self.lock=threading.Lock()
+		self.minInterval=minInterval
+		self.nextTime=0
+		self.nbRequests=0
+
+	def __enter__(self):
+		self.semaphore.acquire()
+		with self.lock:
+			self.nbRequests+=1
+			now=time.monotonic()
+			wait=self.nextTime-now
+			self.nextTime=max(now,self.nextTime)+self.minInterval
+		if wait>0:
+			time.sleep(wait)
+
+	def __exit__(self,*exc):
+		self.semaphore.release()
+
+
+# the wikipedia API of a given language
+# the site object is shared by all the threads : its connection pool is sized for maxConcurrency connections,
+# and every API call (mwclient Site.raw_call) goes through the throttle of the host
+class ApiSource(RevisionSource):
+	def __init__(self,lang,maxConcurrency=4,minInterval=0):
+		if mwclient is None or requests is None:
+			raise ValueError("The API sources require the mwclient and requests modules: "+lang)
+		self.lang=lang
+		self.site=mwclient.Site(lang+'.wikipedia.org')
+		adapter=requests.adapters.HTTPAdapter(pool_connections=1,pool_maxsize=maxConcurrency)
+		self.site.connection.mount('https://',adapter)
+		self.throttle=Throttle(maxConcurrency,minInterval)
+		rawCall=self.site.raw_call
+		def throttledCall(*args,**kwargs):
+			with self.throttle:
+				return rawCall(*args,**kwargs)
+		self.site.raw_call=throttledCall
+
+	def page(self,title):
+		return mwclient.page.Page(self.site,title).resolve_redirect()
+
+	# batched query of revisions (prop=revisions), by revision ids, or by titles for the current revisions (the redirects being resolved) :
+	# returns a dict revid or title -> (title of the page, revid, timestamp, text) for the revisions and pages that exist
+	# (without content, the size of the text in bytes is given instead of the text)
+	def queryRevisions(self,titles=(),revids=(),content=True):
+		if content:
+			parameters={'prop':'revisions','rvprop':'ids|timestamp|content','rvslots':'main'}
+		else:
+			parameters={'prop':'revisions','rvprop':'ids|timestamp|size'}
+		if revids:
+			parameters['revids']='|'.join(str(revid) for revid in revids)
+		else:
+			parameters['titles']='|'.join(titles)
+			parameters['redirects']=1
+		revisions={}
+		currents={}
+		aliases={}
+		# the contents of a batch may be split between several answers
+		while True:
+			data=self.site.api('query',**parameters)
+			query=data.get('query',{})
+			for alias in query.get('normalized',[])+query.get('redirects',[]):
+				aliases[alias['from']]=alias['to']
+			for page in query.get('pages',{}).values():
+				for rev in page.get('revisions',[]):
+					if not content:
+						text=rev.get('size',0)
+					elif 'slots' in rev:
+						text=rev['slots'].get('main',{}).get('*',"")
+					else:
+						text=rev.get('*',"")
+					revisions[rev['revid']]=(page['title'],rev['revid'],rev['timestamp'],text)
+					currents[page['title']]=revisions[rev['revid']]
+			if 'continue' not in data:
+				break
+			parameters.update(data['continue'])
+		if revids:
+			return {revid:revisions[revid] for revid in revids if revid in revisions}
+		result={}
+		for title in titles:
+			resolved=resolveAlias(aliases,title)
+			if resolved in currents:
+				result[title]=currents[resolved]
+		return result
+
+	# titles of the pages of a batch of titles, once normalized and redirected by the API : returns a dict title -> title of the page
+	def pageTitles(self,titles):
+		if not titles:
+			return {}
+		data=self.site.api('query',titles='|'.join(titles),redirects=1)
+		query=data.get('query',{})
+		aliases={}
+		for alias in query.get('normalized',[])+query.get('redirects',[]):
+			aliases[alias['from']]=alias['to']
+		return {title:resolveAlias(aliases,title) for title in titles}
+
+	# batched query of the revisions (title, revid) : the revision ids are queried first, then the titles whose revision has not been found
+	# or belongs to another page (a stale or mistyped revid), as page.revisions(startid,endid) is scoped to the page
+	# returns a dict (title, revid) -> (title of the page, revid, timestamp, text or size), the timestamp being None when the current revision
+	# is given instead of the requested one, for the pages that exist
+	def queryRequests(self,requests,content=True):
+		revids=sorted(set(int(revid) for (title,revid) in requests if str(revid).isdigit()))
+		revisions=self.queryRevisions(revids=revids,content=content) if revids else {}
+		found=[(title,revid) for (title,revid) in requests if str(revid).isdigit() and int(revid) in revisions]
+		# the API is asked for the page of a title only when its normalized title is not the title of the revision (e.g. a redirect)
+		pages=self.pageTitles(sorted(set(title for (title,revid) in found if normalizeTitle(title)!=revisions[int(revid)][0])))
+		matched=set((title,revid) for (title,revid) in found if pages.get(title,normalizeTitle(title))==revisions[int(revid)][0])
+		titles=sorted(set(title for (title,revid) in requests if (title,revid) not in matched))
+		currents=self.queryRevisions(titles=titles,content=content) if titles else {}
+		result={}
+		for (title,revid) in requests:
+			if (title,revid) in matched:
+				result[(title,revid)]=revisions[int(revid)]
+			elif title in currents:
+				(name,currentId,timestamp,text)=currents[title]
+				result[(title,revid)]=(name,currentId,None,text)
+		return result
+
+	def querySizes(self,requests):
+		requests=list(requests)
+		sizes={}
+		for i in range(0,len(requests),batchSize):
+			for (request,(name,revid,timestamp,size)) in self.queryRequests(requests[i:i+batchSize],content=False).items():
+				sizes[request]=size
+		return sizes
+
+
+# gathering of the revision requests of an ApiSource into batched queries : fetch() returns a future, and the pending requests
+# are sent when batchSize requests are pending, or when flush() is called, by the threads of the batcher
+# with maxDelay, a batch that is not full is sent at the latest maxDelay seconds after its first request
+class RevisionBatcher:
+	def __init__(self,source,batchSize=50,nbThreads=2,maxDelay=0):
+		self.source=source
+		self.batchSize=batchSize
+		self.maxDelay=maxDelay
+		self.lock=threading.Lock()
+		# (title, revid) -> future
+		self.pending={}
+		self.executor=concurrent.futures.ThreadPoolExecutor(nbThreads)
+		self.nbBatches=0
+
+	# future of (title of the page, revid, timestamp, text) for the revision revid of a title, or for its current revision
+	# when revid is empty or when the revision does not exist (then timestamp is None) ; revid is None when the page does not exist
+	def fetch(self,title,revid=''):
+		key=(title,str(revid))
+		with self.lock:
+			if key not in self.pending:
+				self.pending[key]=concurrent.futures.Future()
+				if len(self.pending)==1 and self.maxDelay>0:
+					timer=threading.Timer(self.maxDelay,self.flush,[[self.pending[key]]])
+					timer.daemon=True
+					timer.start()
+			future=self.pending[key]
+			if len(self.pending)>=self.batchSize:
+				self.send()
+		return future
+
+	# sending the pending requests, or only if one of the given futures is still pending
+	def flush(self,futures=None):
+		with self.lock:
+			pending=self.pending.values()
+			if futures is None or any(future in pending for future in futures):
+				self.send()
+
+	def send(self):
+		if self.pending:
+			self.executor.submit(self.run,self.pending)
+			self.pending={}
+			self.nbBatches+=1
+
+	def run(self,requests):
+		try:
+			revisions=self.source.queryRequests(list(requests))
+			for (request,future) in requests.items():
+				future.set_result(revisions.get(request,(request[0],None,None,"")))
+		except Exception as e:
+			for future in requests.values():
+				if not future.done():
+					future.set_exception(e)
+
+	def close(self):
+		self.flush()
+		self.executor.shutdown()
+
+
+# a page known locally : revisions is the list of (revid, timestamp, loader) sorted by revid,
+# where loader() returns the text of the revision, or None if the text is not available
+class LocalPage:
+	def __init__(self,name,revisions):
+		self.name=name
+		self.exists=len(revisions)>0
+		self.history=revisions
+
+	def text(self):
+		for (revid,timestamp,loader) in reversed(self.history):
+			text=loader()
+			if text is not None:
+				return text
+		return ""
+
+	# same filters as the API : revisions are yielded from startid/start to endid/end, in the order given by dir
+	def revisions(self,prop='ids|timestamp|flags|comment|user',startid=None,endid=None,start=None,end=None,dir='older',**kwargs):
+		revisions=self.history
+		if dir=='older':
+			revisions=reversed(revisions)
+		for (revid,timestamp,loader) in revisions:
+			if dir=='older':
+				if startid and revid>int(startid) or start and timeKey(timestamp)>timeKey(start):
+					continue
+				if endid and revid<int(endid) or end and timeKey(timestamp)<timeKey(end):
+					break
+			else:
+				if startid and revid<int(startid) or start and timeKey(timestamp)<timeKey(start):
+					continue
+				if endid and revid>int(endid) or end and timeKey(timestamp)>timeKey(end):
+					break
+			rev={'revid':revid,'timestamp':time.strptime(timestamp,'%Y-%m-%dT%H:%M:%SZ')}
+			if 'content' in prop:
+				text=loader()
+				if text is not None:
+					rev['*']=text
+			yield rev
+
+
+# base class of the sources that record locally, for each title, a redirect target and a list of revisions
+class LocalSource(RevisionSource):
+	# returns (redirect target, list of (revid, timestamp, loader)) or None when the title is unknown
+	def lookup(self,title):
+		raise NotImplementedError
+
+	def page(self,title):
+		(title,entry)=self.resolve(title)
+		if entry:
+			return LocalPage(title,entry[1])
+		return LocalPage(title,[])
+
+	# returns (title, entry of lookup()) once the redirects are followed
+	def resolve(self,title,**kwargs):
+		# titles are recorded in the dumps with spaces and a capital first letter
+		title=normalizeTitle(title)
+		entry=self.lookup(title,**kwargs)
+		nbRedirects=0
+		while entry and entry[0] and nbRedirects<maxRedirects:
+			title=entry[0]
+			entry=self.lookup(title,**kwargs)
+			nbRedirects+=1
+		return (title,entry)
+
+
+# the local xml dumps of a given language, indexed by title in a shelve (built at first use, next to the dump)
+# a bz2 dump can only be read if it is a multistream dump, whose pages are read by stream (see dumpReader.MultistreamDump)
+# indexes maps a dump file to its index (a dict-like object, closed by its owner) when it is not FILE.index (e.g. an index built by the scan of the dump)
+# the dump files and the indexes are shared by the threads, and read under a lock
+class DumpSource(LocalSource):
+	def __init__(self,lang,fileNames,indexes=None):
+		self.lang=lang
+		self.lock=threading.RLock()
+		self.dumps=[]
+		self.multistreams=[]
+		self.openedIndexes=[]
+		for fileName in fileNames:
+			if isMultistream(fileName):
+				self.multistreams.append(MultistreamDump(fileName))
+			elif fileName.endswith('.bz2'):
+				raise ValueError("Local dumps must be uncompressed to be read by offset, or multistream dumps with their index: "+fileName)
+			elif indexes and fileName in indexes:
+				self.dumps.append((open(fileName,mode='rb'),indexes[fileName]))
+			else:
+				index=openIndex(fileName)
+				self.openedIndexes.append(index)
+				self.dumps.append((open(fileName,mode='rb'),index))
+
+	# with sizes, the revisions are (revid, timestamp, size of the text), the size being None for the revisions without text
+	def lookup(self,title,sizes=False):
+		redirect=None
+		revisions={}
+		found=False
+		for (dump,index) in self.dumps:
+			with self.lock:
+				entry=index.get(title)
+			if entry:
+				found=True
+				(dumpRedirect,dumpRevisions)=entry
+				redirect=redirect or dumpRedirect
+				for (revid,timestamp,offset,length) in dumpRevisions:
+					# the revisions with a text are preferred to the stub revisions
+					if offset>=0 or revid not in revisions:
+						if sizes:
+							with self.lock:
+								revisions[revid]=(revid,timestamp,readTextSize(dump,offset,length) if offset>=0 else None)
+						else:
+							revisions[revid]=(revid,timestamp,textLoader(dump,offset,length,self.lock))
+		for multistream in self.multistreams:
+			with self.lock:
+				entry=multistream.getSizes(title) if sizes else multistream.get(title)
+			if entry:
+				found=True
+				(dumpRedirect,dumpRevisions)=entry
+				redirect=redirect or dumpRedirect
+				for (revid,timestamp,text) in dumpRevisions:
+					if text is not None or revid not in revisions:
+						revisions[revid]=(revid,timestamp,text if sizes else (lambda text=text: text))
+		if not found:
+			return None
+		return (redirect,[revisions[revid] for revid in sorted(revisions.keys())])
+
+	# the sizes are read in the text tags of the dumps (see dumpReader.textSize()), without reading the texts
+	# same choice of the revision as RevisionSource.querySizes() : the revision revid, or else the last revision with a text
+	def querySizes(self,requests):
+		sizes={}
+		for (title,revid) in requests:
+			(pageTitle,entry)=self.resolve(title,sizes=True)
+			if not entry or not entry[1]:
+				continue
+			revSizes={rev:size for (rev,timestamp,size) in entry[1] if size is not None}
+			if str(revid).isdigit() and int(revid) in revSizes:
+				sizes[(title,revid)]=revSizes[int(revid)]
+			else:
+				sizes[(title,revid)]=revSizes[max(revSizes)] if revSizes else 0
+		return sizes
+
+	def close(self):
+		for (dump,index) in self.dumps:
+			dump.close()
+		for index in self.openedIndexes:
+			index.close()
+		for multistream in self.multistreams:
+			multistream.close()
+
+# returns a function that reads a text in the dump
+def textLoader(dump,offset,length,lock):
+	if offset<0:
+		return lambda: None
+	def load():
+		with lock:
+			return readText(dump,offset,length)
+	return load
+
+# opening the title index of a dump, which is built if it does not exist or if its building has been interrupted
+def openIndex(fileName):
+	indexName=fileName+'.index'
+	try:
+		index=shelve.open(indexName,flag='r')
+		if '\tcomplete' in index:
+			return index
+		index.close()
+	except dbm.error:
+		pass
+	print("Indexing",fileName)
+	with shelve.open(indexName,flag='n') as index:
+		for (title,redirect,revisions) in indexPages(fileName):
+			index[title]=(redirect,revisions)
+		index['\tcomplete']=True
+	return shelve.open(indexName,flag='r')
+
+
+# a stand-in source : pages is a dict title -> list of (revid, timestamp, text), and redirects a dict title -> title
+class MemorySource(LocalSource):
+	def __init__(self,lang,pages,redirects=None):
+		self.lang=lang
+		self.pages=pages
+		self.redirects=redirects or {}
+
+	def lookup(self,title):
+		if title in self.redirects:
+			return (self.redirects[title],[])
+		if title in self.pages:
+			return (None,[(revid,timestamp,(lambda text=text: text)) for (revid,timestamp,text) in sorted(self.pages[title])])
+		return None
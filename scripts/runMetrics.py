@@ -0,0 +1,132 @@
+# -*- coding:utf8 -*-
+
+"""
+Metrics of a dump run : time spent in each stage, event counters and gauges, written periodically in a metrics file
+that a local scraper can read
+
+The file is written in the Prometheus text format when its name ends with .prom (the file is replaced at each writing),
+and in JSON lines otherwise (a line is appended at each writing).
+The stages run by several threads are timed in each thread, so that their summed time can exceed the elapsed time.
+
+Usage :
+	metrics=RunMetrics(fileName,interval,labels)
+	with metrics.timer('clean'):
+		...
+	metrics.count('failures',1)
+	metrics.gauge('cache_hits',lambda: cache.hits)
+	metrics.start()		# writing every interval seconds, by a background thread
+	...
+	metrics.close()		# last writing
+"""
+
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+prefix='wikipara' # prefix of the Prometheus metric names
+
+
+class RunMetrics:
+	def __init__(self,fileName,interval=10,labels=None):
+		self.fileName=fileName
+		self.interval=interval
+		self.labels=labels or {}
+		self.lock=threading.Lock()
+		self.startTime=time.time()
+		# stage -> [number of calls, total time in seconds]
+		self.timers={}
+		self.counters={}
+		# name -> function that returns the current value
+		self.gauges={}
+		self.stopped=threading.Event()
+		self.thread=None
+
+	@contextlib.contextmanager
+	def timer(self,stage):
+		t=time.perf_counter()
+		try:
+			yield
+		finally:
+			self.addTime(stage,time.perf_counter()-t)
+
+	def addTime(self,stage,seconds):
+		with self.lock:
+			if stage not in self.timers:
+				self.timers[stage]=[0,0]
+			self.timers[stage][0]+=1
+			self.timers[stage][1]+=seconds
+
+	def count(self,name,value=1):
+		with self.lock:
+			self.counters[name]=self.counters.get(name,0)+value
+
+	def gauge(self,name,function):
+		self.gauges[name]=function
+
+	def snapshot(self):
+		with self.lock:
+			stages={stage:{'calls':calls,'seconds':seconds} for (stage,(calls,seconds)) in self.timers.items()}
+			counters=dict(self.counters)
+		gauges={}
+		for (name,function) in self.gauges.items():
+			try:
+				gauges[name]=function()
+			except Exception:
+				gauges[name]=None
+		return {'time':time.time(),'elapsed':time.time()-self.startTime,'labels':self.labels,'stages':stages,'counters':counters,'gauges':gauges}
+
+	def write(self):
+		snapshot=self.snapshot()
+		if self.fileName.endswith('.prom'):
+			# the file is replaced atomically, so that the scraper never reads a partial file
+			tmpName=self.fileName+'.tmp'
+			with open(tmpName,mode='w',encoding='utf8') as output:
+				output.write(prometheusText(snapshot))
+			os.replace(tmpName,self.fileName)
+		else:
+			with open(self.fileName,mode='a',encoding='utf8') as output:
+				output.write(json.dumps(snapshot)+"\n")
+
+	# writing every interval seconds, until close()
+	def start(self):
+		def loop():
+			while not self.stopped.wait(self.interval):
+				try:
+					self.write()
+				except OSError as e:
+					print("Error while writing the metrics:",e)
+		self.thread=threading.Thread(target=loop,daemon=True)
+		self.thread.start()
+
+	def close(self):
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+		self.write()
+
+# conversion of a snapshot into the Prometheus text format
+def prometheusText(snapshot):
+	lines=[]
+	def add(name,kind,values):
+		lines.append("# TYPE "+prefix+"_"+name+" "+kind)
+		for (labels,value) in values:
+			if value is not None:
+				lines.append(prefix+"_"+name+labelText(dict(snapshot['labels'],**labels))+" "+repr(float(value)))
+	add('elapsed_seconds','gauge',[({},snapshot['elapsed'])])
+	add('stage_seconds_total','counter',[({'stage':stage},values['seconds']) for (stage,values) in sorted(snapshot['stages'].items())])
+	add('stage_calls_total','counter',[({'stage':stage},values['calls']) for (stage,values) in sorted(snapshot['stages'].items())])
+	add('events_total','counter',[({'event':name},value) for (name,value) in sorted(snapshot['counters'].items())])
+	for (name,value) in sorted(snapshot['gauges'].items()):
+		add(metricName(name),'gauge',[({},value)])
+	return "\n".join(lines)+"\n"
+
+def labelText(labels):
+	if not labels:
+		return ""
+	return "{"+",".join(metricName(key)+'="'+str(value).replace('\\','\\\\').replace('"','\\"')+'"' for (key,value) in sorted(labels.items()))+"}"
+
+def metricName(name):
+	return re.sub(r'[^a-zA-Z0-9_]','_',name)
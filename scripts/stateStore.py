@@ -0,0 +1,181 @@
+# -*- coding:utf8 -*-
+
+"""
+State of a dump run (processed pages, first revision ids, parent categories, stats), recorded in a single sqlite file
+
+The file is opened in WAL mode, so that several processes can read and write it at the same time.
+The writes are committed by batches (every commitInterval writes, or commitDelay seconds), and the counters
+are incremented by the database itself, without read-modify-write in python.
+With autoCommit=False, the writes are committed only by commitIfDue() (or close()), so that the caller decides
+the points where the state is consistent (e.g. between two pages, with the checkpoint of the scan).
+
+	state=StateStore(fileName)
+	processedPages=state.table('processed')     # dict-like : key -> pickled value
+	stats=state.counters('stats')               # dict-like : key -> number, with stats.add(key,value)
+	...
+	state.close()
+
+Usage : python3 stateStore.py OUTPUT_PATH LANG
+migrates the shelves OUTPUT_PATH/parentCats.LANG, statsPerCat.LANG, stats.LANG, processed.LANG and firstRevisionId.LANG
+into OUTPUT_PATH/state.LANG.sqlite
+"""
+
+import os
+import pickle
+import shelve
+import sqlite3
+import sys
+import threading
+import time
+
+commitInterval=1000 # max number of writes between two commits
+commitDelay=2 # max delay (in seconds) between the first write and the commit, so that the other processes are not locked out
+
+# former shelves : name -> True for the counters
+shelves={
+	'parentCats':False,
+	'statsPerCat':True,
+	'stats':True,
+	'processed':False,
+	'firstRevisionId':False,
+}
+
+
+class StateStore:
+	def __init__(self,fileName,autoCommit=True):
+		self.autoCommit=autoCommit
+		self.lock=threading.RLock()
+		self.db=sqlite3.connect(fileName,timeout=60,check_same_thread=False)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS entries (store TEXT, key TEXT, value BLOB, PRIMARY KEY (store,key))")
+		# no type for the counter values, so that integers remain integers
+		self.db.execute("CREATE TABLE IF NOT EXISTS counters (store TEXT, key TEXT, value, PRIMARY KEY (store,key))")
+		self.db.commit()
+		self.nbWrites=0
+		self.firstWrite=0
+
+	def table(self,name):
+		return StateTable(self,name)
+
+	def counters(self,name):
+		return StateCounters(self,name)
+
+	def execute(self,query,parameters):
+		with self.lock:
+			return self.db.execute(query,parameters).fetchall()
+
+	def write(self,query,parameters):
+		with self.lock:
+			self.db.execute(query,parameters)
+			if self.nbWrites==0:
+				self.firstWrite=time.time()
+			self.nbWrites+=1
+			if self.autoCommit:
+				self.commitIfDue()
+
+	# commit when commitInterval writes or commitDelay seconds have passed since the first uncommitted write
+	def commitIfDue(self):
+		with self.lock:
+			if self.nbWrites>=commitInterval or self.nbWrites>0 and time.time()-self.firstWrite>commitDelay:
+				self.commit()
+
+	def commit(self):
+		with self.lock:
+			self.db.commit()
+			self.nbWrites=0
+
+	def close(self):
+		with self.lock:
+			self.db.commit()
+			self.db.close()
+
+
+# a dict-like table : the values are pickled
+class StateTable:
+	def __init__(self,state,name):
+		self.state=state
+		self.name=name
+
+	def __contains__(self,key):
+		return len(self.state.execute("SELECT 1 FROM entries WHERE store=? AND key=?",(self.name,key)))>0
+
+	def __getitem__(self,key):
+		rows=self.state.execute("SELECT value FROM entries WHERE store=? AND key=?",(self.name,key))
+		if not rows:
+			raise KeyError(key)
+		return pickle.loads(rows[0][0])
+
+	def get(self,key,default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __setitem__(self,key,value):
+		self.state.write("INSERT OR REPLACE INTO entries VALUES (?,?,?)",(self.name,key,pickle.dumps(value)))
+
+	def keys(self):
+		return [row[0] for row in self.state.execute("SELECT key FROM entries WHERE store=?",(self.name,))]
+
+	def items(self):
+		return [(key,pickle.loads(value)) for (key,value) in self.state.execute("SELECT key,value FROM entries WHERE store=?",(self.name,))]
+
+
+# dict-like counters : add() increments a counter in a single statement, which is safe with concurrent processes
+class StateCounters:
+	def __init__(self,state,name):
+		self.state=state
+		self.name=name
+
+	def add(self,key,value):
+		self.state.write("INSERT INTO counters VALUES (?,?,?) ON CONFLICT (store,key) DO UPDATE SET value=value+excluded.value",(self.name,key,value))
+
+	def __contains__(self,key):
+		return len(self.state.execute("SELECT 1 FROM counters WHERE store=? AND key=?",(self.name,key)))>0
+
+	def __getitem__(self,key):
+		rows=self.state.execute("SELECT value FROM counters WHERE store=? AND key=?",(self.name,key))
+		if not rows:
+			raise KeyError(key)
+		return rows[0][0]
+
+	def __setitem__(self,key,value):
+		self.state.write("INSERT OR REPLACE INTO counters VALUES (?,?,?)",(self.name,key,value))
+
+	def keys(self):
+		return [row[0] for row in self.state.execute("SELECT key FROM counters WHERE store=?",(self.name,))]
+
+	def items(self):
+		return self.state.execute("SELECT key,value FROM counters WHERE store=?",(self.name,))
+
+
+# copy of the shelves of a language into the state file
+def migrate(outputPath,lang):
+	state=StateStore(os.path.join(outputPath,'state.'+lang+'.sqlite'))
+	for (name,isCounter) in shelves.items():
+		fileName=os.path.join(outputPath,name+'.'+lang)
+		try:
+			shelf=shelve.open(fileName,flag='r')
+		except Exception:
+			print("No shelve",fileName)
+			continue
+		if isCounter:
+			target=state.counters(name)
+		else:
+			target=state.table(name)
+		n=0
+		for (key,value) in shelf.items():
+			target[key]=value
+			n+=1
+		shelf.close()
+		print(name,":",n,"entries")
+	state.close()
+
+#**************************************************************** MAIN
+
+if __name__=="__main__":
+	if len(sys.argv)!=3:
+		print(__doc__)
+		sys.exit()
+	migrate(sys.argv[1],sys.argv[2])
@@ -0,0 +1,256 @@
+# -*- coding:utf8 -*-
+
+"""
+Conversion of the wikitext of an article into raw text
+
+wiki_dump_reader.Cleaner() is not used, because it removes hyperlink texts
+
+cleaning rules
+
+[[...|texte du lien à conserver]]
+{{lien web| à supprimer}}
+<ref>référence à supprimer</ref>
+''à mettre entre guillemets''
+{{balises à supprimer}}
+{| tableaux à supprimer |}
+{{date-|20 avril 1961}}
+
+cleanText() reads the text in a single scan, with a stack of the open constructions ({{...}}, {|...|}, [[...]], <ref>...</ref>),
+so that they are handled at any depth of nesting. The simple links, the empty lines and the quotes are then replaced by
+three substitutions on the remaining text.
+cleanTextCascade() is the former implementation, made of 13 successive regex substitutions (nesting handled up to 4 levels
+for the templates and 2 levels for the links), kept as a reference.
+
+Both give the same output on usual articles (see the samples of cleanerSamples). The outputs differ :
+	- where the cascade leaves residue on well-formed markup : templates nested more than 4 levels deep, links nested more than
+	  2 levels deep, templates inside file captions, nested tables
+	- on malformed markup : constructions that are not closed, or that cross each other (e.g. {|...{{...|}...}}), comments without -->.
+	  The cascade removes whatever its successive regexes happen to match, while the scan keeps the constructions that are not
+	  closed as they are. This is not rare on random markup : a few percent of random strings of markup tokens (2 to 4% of 20000
+	  strings of up to 12 tokens, depending on the tokens) are cleaned differently, all of them malformed.
+
+Usage : python3 wikitextCleaner.py DUMP [NB_PAGES]
+compares both implementations on the articles of a dump, and prints the titles of the articles whose cleaned texts differ
+	python3 wikitextCleaner.py --samples [DIR]
+checks cleanText() on the samples of DIR (by default, cleanerSamples next to this script) : NAME.wiki is a wikitext,
+and NAME.txt its expected output, given by cleanTextCascade() ; exits with status 1 when an output differs
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+
+from dumpReader import readChunks,pageSpans,decode,regexNs,regexTitle,regexText
+
+cleanerVersion=2 # to be changed when the output of cleanText() changes (the cleaned texts are cached)
+
+regexCat=re.compile(r'\[\[\s*[KC]at\w+\s*:(.*?)\]\]')
+regexLink=re.compile(r'\[\[(?:[^\[\]]*\|)?([^\[\]]+)\]\]',re.S)
+regexBaliseAConserver=re.compile(r'\{\{(?:[^{}\n]*\|)([^|{}\n]*)\}\}',re.S)
+regexBalise=re.compile(r'\{\{[^{}]*\}\}',re.S)
+regexComment=re.compile(r'<!--[^>]*-->',re.S)
+regexRef=re.compile(r'<ref\b.*?<\/ref>',re.S)
+regexMarkup=re.compile(r'<[^>]*>',re.S)
+regexTableau=re.compile(r'\{\|.*?\|\}',re.S)
+regexEmptyLines=re.compile(r'\n\s*',re.S)
+regexQuotes=re.compile(r"''",re.S)
+
+# tokens of the single scan : the categories, the comments, the references, and the links and templates without nested construction
+# are read as a whole, the other constructions are read by their opening and closing tokens
+# (the lookahead lets the regex engine skip quickly the characters that cannot start a token)
+regexToken=re.compile(r"(?=[\[\]{}|<])(?:(?P<cat>\[\[\s*[KC]at\w+\s*:.*?\]\])|(?P<comment><!--[^>]*-->)|(?P<link>\[\[[^\[\]{}<]+\]\])|(?P<template>\{\{[^\[\]{}<]*\}\})|(?P<ref><ref\b[^<]*</ref>)|\[\[|\]\]|\{\{|\}\}|\{\||\|\}(?!\})|<ref\b|</ref>)")
+regexNotToKeep=re.compile(r'[{}\n]')
+
+# closing token of each construction
+closers={'[[':']]','{{':'}}','{|':'|}','<ref':'</ref>'}
+# constructions whose content is removed
+removed=('{{','{|','<ref')
+
+
+# single scan cleaning : the stack records, for each open construction, (opening token, position, list of the cleaned parts of its content)
+def cleanText(text):
+	if not text:
+		return ""
+	output=[]
+	parts=output
+	stack=[]
+	# number of open constructions whose content is removed
+	nbRemoved=0
+	refOpen=False
+	# position of the next </ref>
+	refEnd=0
+	pos=0
+	for m in regexToken.finditer(text):
+		kind=m.lastgroup
+		if kind=='link':
+			# the links without nested construction are left in the text, and replaced at the end in a single substitution
+			continue
+		start=m.start()
+		if start>pos:
+			parts.append(text[pos:start])
+		pos=m.end()
+		if kind=='cat' or kind=='comment':
+			continue
+		if kind=='template':
+			if nbRemoved==0:
+				parts.append(templateText(m.group()[2:-2]))
+			continue
+		if kind=='ref':
+			if not refOpen:
+				continue
+			# the end of the reference closes the open reference
+			token='</ref>'
+		else:
+			token=m.group()
+		if token in closers:
+			if token=='<ref':
+				# references are not nested : the first </ref> closes the open reference, and without </ref> the text is kept
+				if refEnd>=0 and refEnd<pos:
+					refEnd=text.find('</ref>',pos)
+				if refOpen or refEnd<0:
+					parts.append(token)
+					continue
+				refOpen=True
+			if token in removed:
+				nbRemoved+=1
+			stack.append((token,start,[]))
+			parts=stack[-1][2]
+			continue
+		if token=='|}' and not (stack and stack[-1][0]=='{|'):
+			parts.append(token)
+			continue
+		# looking for the construction closed by the token : the constructions opened inside and not closed are kept as they are
+		k=len(stack)-1
+		while k>=0 and closers[stack[k][0]]!=token:
+			k-=1
+		if k<0:
+			parts.append(token)
+			continue
+		while len(stack)>k+1:
+			nbRemoved-=unstack(stack,output)
+		(opening,begin,content)=stack.pop()
+		parts=stack[-1][2] if stack else output
+		if opening in removed:
+			nbRemoved-=1
+		if opening=='<ref':
+			refOpen=False
+		elif opening=='[[':
+			if start==begin+2:
+				parts.append('[[]]')
+			else:
+				parts.append(linkText(regexLink.sub('\g<1>',"".join(content))))
+		elif opening=='{{' and nbRemoved==0:
+			# a template with a nested template is removed (the result of a nested template is not needed, as it is removed with the enclosing construction)
+			if not regexNotToKeep.search(text,begin+2,start):
+				parts.append(templateText(regexLink.sub('\g<1>',"".join(content))))
+	if len(text)>pos:
+		parts.append(text[pos:])
+	# the constructions that are not closed are kept as they are
+	while stack:
+		unstack(stack,output)
+	text="".join(output)
+	text=regexLink.sub('\g<1>',text)
+	text=regexEmptyLines.sub("\n",text)
+	return regexQuotes.sub('"',text)
+
+# the text of a link is its last part
+def linkText(content):
+	if '[' in content or ']' in content:
+		return '[['+content+']]'
+	return content[content.rfind('|',0,len(content)-1)+1:]
+
+# templates on a single line are replaced by their last parameter, the others are removed
+def templateText(content):
+	if '|' not in content or '\n' in content:
+		return ""
+	return content[content.rfind('|')+1:]
+
+# closing a construction without its closing token : its opening token and its content are added to the enclosing content
+# returns 1 if the content of the construction was to be removed
+def unstack(stack,output):
+	(opening,begin,content)=stack.pop()
+	parts=stack[-1][2] if stack else output
+	parts.append(opening)
+	parts.extend(content)
+	return 1 if opening in removed else 0
+
+# former cleaning, by successive substitutions
+def cleanTextCascade(text) :
+	if text:
+		text=regexCat.sub('',text)
+		text=regexLink.sub('\g<1>',text)
+		# suppression des balises en plusieurs temps, car elles sont possiblement imbriquées jusqu'à 3 niveaux
+		text=regexBaliseAConserver.sub('\g<1>',text)
+		text=regexComment.sub('',text)
+		text=regexBalise.sub('',text)
+		text=regexBalise.sub('',text)
+		text=regexBalise.sub('',text)
+		text=regexBalise.sub('',text)
+		text=regexLink.sub('\g<1>',text)
+
+		text=regexTableau.sub('',text)
+		text=regexRef.sub('',text)
+		text=regexEmptyLines.sub("\n",text)
+		text=regexQuotes.sub('"',text)
+
+		return text
+	else:
+		return ""
+
+# parity test on the samples of a directory : returns the number of samples whose cleaned text differs from the expected output
+def checkSamples(sampleDir):
+	nbDiff=0
+	fileNames=sorted(glob.glob(os.path.join(sampleDir,'*.wiki')))
+	for fileName in fileNames:
+		with open(fileName,encoding='utf8') as f:
+			text=f.read()
+		with open(fileName[:-len('.wiki')]+'.txt',encoding='utf8') as f:
+			expected=f.read()
+		if cleanText(text)!=expected:
+			nbDiff+=1
+			print("Different:",os.path.basename(fileName))
+	print(len(fileNames),"samples,",nbDiff,"differences")
+	return nbDiff
+
+#**************************************************************** MAIN
+
+if __name__=="__main__":
+	if len(sys.argv)<2:
+		print(__doc__)
+		sys.exit()
+	if sys.argv[1]=='--samples':
+		sampleDir=sys.argv[2] if len(sys.argv)>2 else os.path.join(os.path.dirname(os.path.abspath(__file__)),'cleanerSamples')
+		sys.exit(1 if checkSamples(sampleDir) else 0)
+	dumpName=sys.argv[1]
+	nbPages=int(sys.argv[2]) if len(sys.argv)>2 else 1000
+
+	n=0
+	nbDiff=0
+	timeCascade=0
+	timeScan=0
+	for (offset,chunk) in readChunks(dumpName,4*1024*1024):
+		for (start,end) in pageSpans(chunk):
+			mNs=regexNs.search(chunk,start,end)
+			mText=regexText.search(chunk,start,end)
+			if not mNs or mNs.group(1)!=b'0' or not mText or mText.start(1)<0:
+				continue
+			title=decode(regexTitle.search(chunk,start,end).group(1))
+			text=decode(mText.group(1))
+			t=time.time()
+			cascade=cleanTextCascade(text)
+			timeCascade+=time.time()-t
+			t=time.time()
+			scan=cleanText(text)
+			timeScan+=time.time()-t
+			n+=1
+			if cascade!=scan:
+				nbDiff+=1
+				print("Different:",title)
+			if n>=nbPages:
+				break
+		if n>=nbPages:
+			break
+	print(n,"articles,",nbDiff,"differences")
+	print("Time : cascade=%.2fs, single scan=%.2fs"%(timeCascade,timeScan))